@@ -0,0 +1,203 @@
+#
+# Archive of the converted ledgers: a Parquet dataset per table, partitioned by organization number and period
+#   <archive_dir>/ledger/orgno=<orgno>/period=<YYYYMM>/run-<time>.parquet    - the ledger after the company rules
+#   <archive_dir>/journal/orgno=<orgno>/period=<YYYYMM>/run-<time>.parquet   - the Maconomy journal
+# A full conversion replaces the files of its partition (the latest conversion of a month is the one that counts),
+# an incremental conversion adds its new lines (and reversals) as one more file.
+# The files are written with fixed schemas (categories as their plain values), so all the files of a table can be read as one dataset.
+#
+# read_archive() only opens the partitions of the requested organization numbers and periods and only reads the requested
+# columns, and the other conditions are pushed down to the Parquet row groups. Example, all 6000-series postings on a job in 2025:
+#   read_archive('ledger', period_from='202501', period_to='202512', columns=['Dato', 'Konto', 'Beløp', 'Text'],
+#                where=[('Konto', '>=', 6000), ('Konto', '<', 7000), ('Prosjekt', '==', 31242)])
+# or from the command line: python archive.py ledger --from 202501 --to 202512 --where "Konto>=6000" "Konto<7000" "Prosjekt==31242"
+# pyarrow is only imported by the functions that write or read the archive, so importing ARCHIVE_DIR stays cheap.
+import pandas as pd
+import argparse
+import glob
+import os
+import re
+from datetime import datetime
+from hlt_reader import HLT_FILENAME_PATTERN
+
+ARCHIVE_DIR = os.path.join(os.path.expanduser("~"), ".vimpact", "archive")
+
+# The columns of the archived tables with their Arrow types
+ARCHIVE_COLUMNS = {
+    'ledger': {
+        'Konto': 'int64',
+        'MVA': 'int16',
+        'Avdeling': 'int64',
+        'Prosjekt': 'int64',
+        'Oppgave': 'string',
+        'Medarbeider': 'int64',
+        'ID': 'int64',
+        'Dato': 'timestamp[ns]',
+        'Beløp': 'int64',
+        'Text': 'string',
+    },
+    'journal': {
+        'GeneralJournal:Format': 'string',
+        'TransactionNumber': 'string',
+        'EntryDate': 'string',
+        'EntryText': 'string',
+        'TypeOfEntry': 'string',
+        'AccountNumber': 'int64',
+        'FinanceVATCode': 'int64',
+        'DebitBase': 'float64',
+        'CreditBase': 'float64',
+        'EntityName': 'int64',
+        'JobNumber': 'int64',
+        'TaskName': 'string',
+        'ActivityNumber': 'int64',
+        'EmployeeNumber': 'int64',
+    },
+}
+
+# The partition keys are read as text (organization numbers and periods are not numbers to compute with)
+PARTITION_COLUMNS = {'orgno': 'string', 'period': 'string'}
+
+OPERATORS = {
+    '==': lambda field, value: field == value,
+    '!=': lambda field, value: field != value,
+    '>=': lambda field, value: field >= value,
+    '<=': lambda field, value: field <= value,
+    '>':  lambda field, value: field > value,
+    '<':  lambda field, value: field < value,
+    'in': lambda field, value: field.isin(list(value)),
+}
+
+def _schema(columns: dict[str, str]):
+    import pyarrow as pa
+    return pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns.items()])
+
+# The frame with the columns of the table schema as plain values (categories of numbers as integers, other categories as text)
+def _archive_table(df: pd.DataFrame, table: str):
+    import pyarrow as pa
+    schema = _schema(ARCHIVE_COLUMNS[table])
+    columns = {}
+    for name in schema.names:
+        values = df[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('Int64') if pd.api.types.is_numeric_dtype(values.cat.categories) else values.astype(object)
+        if pa.types.is_string(schema.field(name).type):
+            values = values.astype(object).where(values.notna(), None)
+        elif pa.types.is_integer(schema.field(name).type) and pd.api.types.is_float_dtype(values):
+            values = values.astype('Int64')
+        columns[name] = values.reset_index(drop=True)
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+
+def _partition_dir(archive_dir: str, table: str, orgno: str, period: str) -> str:
+    return os.path.join(archive_dir, table, f"orgno={orgno}", f"period={period}")
+
+# Archive the ledger (after company_specific_transactions) and the Maconomy journal of one conversion.
+# With append the files are added to the partition (incremental runs), otherwise they replace the files of the partition.
+def archive_run(ledger_df: pd.DataFrame, maconomy_df: pd.DataFrame, orgno: str, period: str, archive_dir: str = ARCHIVE_DIR, append: bool = False) -> list[str]:
+    if not re.fullmatch(r"\d+", str(orgno)) or not re.fullmatch(r"\d{6}", str(period)):
+        raise ValueError(f"Invalid organization number or period (YYYYMM): {orgno}, {period}")
+
+    import pyarrow.parquet as pq
+    run = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    filenames = []
+    for table, df in (('ledger', ledger_df), ('journal', maconomy_df)):
+        partition_dir = _partition_dir(archive_dir, table, orgno, period)
+        os.makedirs(partition_dir, exist_ok=True)
+        old_files = [] if append else glob.glob(os.path.join(partition_dir, "*.parquet"))
+
+        # The new file is written under a hidden temporary name (skipped by the dataset reader) and renamed,
+        # so a reader never sees a half written file
+        filename = os.path.join(partition_dir, f"run-{run}.parquet")
+        temp_filename = os.path.join(partition_dir, f".run-{run}.parquet.tmp")
+        pq.write_table(_archive_table(df, table), temp_filename)
+        os.replace(temp_filename, filename)
+        for old_file in old_files:
+            os.remove(old_file)
+        filenames.append(filename)
+    return filenames
+
+# Archive the conversion of an HL file, with the organization number and period from the file name (HLTrans_<orgno>_<YYYYMM>.HLT)
+def archive_hl_file(hl_filename: str, ledger_df: pd.DataFrame, maconomy_df: pd.DataFrame, archive_dir: str = ARCHIVE_DIR, append: bool = False) -> list[str]:
+    match = HLT_FILENAME_PATTERN.search(os.path.basename(hl_filename))
+    if not match:
+        print(f"\033[93m{os.path.basename(hl_filename)} is not named HLTrans_<orgno>_<YYYYMM>.HLT, the conversion is not archived.\033[0m")
+        return []
+    orgno, period = match.groups()
+    filenames = archive_run(ledger_df, maconomy_df, orgno, period, archive_dir, append)
+    print(f"\033[95mThe ledger and journal of {orgno} {period} are archived in {archive_dir}.\033[0m")
+    return filenames
+
+# Read an archived table ('ledger' or 'journal'). Only the partitions of the organization numbers and the period range
+# (YYYYMM, inclusive) are opened, and only the columns are read (all with None). where is a list of (column, operator, value)
+# conditions that must all hold, with the operators ==, !=, >=, <=, >, < and in. Returns None if nothing is archived.
+def read_archive(table: str = 'ledger', orgnos: list[str] = None, period_from: str = None, period_to: str = None,
+                 columns: list[str] = None, where: list[tuple] = None, archive_dir: str = ARCHIVE_DIR) -> pd.DataFrame:
+    table_dir = os.path.join(archive_dir, table)
+    if not os.path.isdir(table_dir):
+        print(f"\033[91mThere is no {table} archive in {archive_dir}.\033[0m")
+        return None
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    partitioning = ds.partitioning(_schema(PARTITION_COLUMNS), flavor="hive")
+    dataset = ds.dataset(table_dir, schema=_schema({**ARCHIVE_COLUMNS[table], **PARTITION_COLUMNS}), format="parquet", partitioning=partitioning)
+
+    conditions = []
+    if orgnos:
+        conditions.append(ds.field('orgno').isin([str(orgno) for orgno in orgnos]))
+    if period_from:
+        conditions.append(ds.field('period') >= str(period_from))
+    if period_to:
+        conditions.append(ds.field('period') <= str(period_to))
+    for column, operator, value in where or []:
+        if operator not in OPERATORS:
+            raise ValueError(f"Unknown operator {operator}, use one of {', '.join(OPERATORS)}")
+        conditions.append(OPERATORS[operator](ds.field(column), value))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    # The partition columns are always returned, so the rows of different companies and months can be told apart
+    if columns is not None:
+        columns = ['orgno', 'period'] + [column for column in columns if column not in ('orgno', 'period')]
+    # Integers with missing values (jobs, tasks, travel IDs) stay integers (Int64), as in the ledger
+    return dataset.to_table(columns=columns, filter=expression).to_pandas(types_mapper=lambda type: pd.Int64Dtype() if pa.types.is_int64(type) else None)
+
+# A condition from the command line, e.g. "Konto>=6000" or "Prosjekt==31242" (numbers are compared as numbers)
+def parse_condition(condition: str) -> tuple:
+    match = re.fullmatch(r"\s*([^=!<>\s]+)\s*(==|!=|>=|<=|>|<)\s*(.*?)\s*", condition)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid condition {condition}, use e.g. Konto>=6000")
+    column, operator, value = match.groups()
+    if re.fullmatch(r"-?\d+", value):
+        value = int(value)
+    elif re.fullmatch(r"-?\d*\.\d+", value):
+        value = float(value)
+    return column, operator, value
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query the archive of converted ledgers and Maconomy journals.")
+    parser.add_argument("table", choices=list(ARCHIVE_COLUMNS), help="The archived table")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="The archive directory")
+    parser.add_argument("--orgno", nargs="*", help="Only these organization numbers")
+    parser.add_argument("--from", dest="period_from", help="First period (YYYYMM)")
+    parser.add_argument("--to", dest="period_to", help="Last period (YYYYMM)")
+    parser.add_argument("--year", help="All the periods of this year (instead of --from and --to)")
+    parser.add_argument("--columns", nargs="*", help="Only read these columns")
+    parser.add_argument("--where", nargs="*", type=parse_condition, default=[], help="Conditions like Konto>=6000 or Prosjekt==31242")
+    parser.add_argument("--csv", help="Write the result to this CSV file instead of printing it")
+    args = parser.parse_args()
+
+    period_from, period_to = (f"{args.year}01", f"{args.year}12") if args.year else (args.period_from, args.period_to)
+    df = read_archive(args.table, args.orgno, period_from, period_to, args.columns, args.where, os.path.expanduser(args.archive_dir))
+    if df is None:
+        return
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+        print(f"\033[95m{len(df)} rows written to {args.csv}.\033[0m")
+    else:
+        print(df.to_string(index=False))
+        print(f"\033[96m{len(df)} rows\033[0m")
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,126 @@
 # Description: This script is used to authenticate the user and get the access token to access the Maconomy API.
 # The last part is fetching the data from the Maconomy API and returning it as a DataFrame.
 
-from msal import PublicClientApplication
+from concurrent.futures import ThreadPoolExecutor
+from msal import PublicClientApplication, SerializableTokenCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import requests
 import pandas as pd
+import os
+from profiling import stage
+from mapping_tables import MappingTables, compile_mapping
 
-def get_mapping_api(client_id: str, tenant_id: str, scopes: list[str], api_gateway: str)-> pd.DataFrame:
+# Number of records requested per page from the Maconomy filter endpoints
+PAGE_SIZE = 1000
+
+# The MSAL applications of this process with their token cache, so a long running process (watch.py) keeps the tokens in memory
+_applications = {}
+
+# The MSAL token cache is kept on disk between runs, so the interactive login is only needed when the refresh token has expired.
+def get_access_token(client_id: str, tenant_id: str, scopes: list[str], token_cache_file: str = None) -> str:
 
     # Defining the Azure and App registration ID values
     authority = f"https://login.microsoftonline.com/{tenant_id}"
 
-    app = PublicClientApplication(client_id, authority=authority)
+    key = (client_id, authority, token_cache_file)
+    if key not in _applications:
+        token_cache = SerializableTokenCache()
+        if token_cache_file and os.path.exists(token_cache_file):
+            with open(token_cache_file, "r") as f:
+                token_cache.deserialize(f.read())
+        _applications[key] = (PublicClientApplication(client_id, authority=authority, token_cache=token_cache), token_cache)
+    app, token_cache = _applications[key]
 
     # Attempt to get a token silently
     accounts = app.get_accounts()
     result = app.acquire_token_silent(scopes, account=accounts[0]) if accounts else None
-    
+
     # If no token is found, use interactive login
     if not result:
         result = app.acquire_token_interactive(scopes)
 
-    access_token = result["access_token"]
-    headers = {"Authorization": f"Bearer {access_token}"}
+    # Only the user can read the cached tokens
+    if token_cache_file and token_cache.has_state_changed:
+        os.makedirs(os.path.dirname(os.path.abspath(token_cache_file)), exist_ok=True)
+        with open(os.open(token_cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            f.write(token_cache.serialize())
+
+    return result["access_token"]
+
+# A session keeps the connection open between the pages of an endpoint. Failed calls (connection errors, throttling and server errors)
+# are retried with backoff. A requests.Session is not thread-safe, so every thread uses its own session.
+def create_session(access_token: str, retries: int = 3, backoff_factor: float = 0.5) -> requests.Session:
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=1)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Authorization": f"Bearer {access_token}"})
+    return session
+
+# Fetch all the records of a Maconomy filter endpoint. Follows the offset until a page comes back with less than page_size records.
+def fetch_records(session: requests.Session, api_url: str, fields: list[str], page_size: int = PAGE_SIZE, name: str = "records") -> list[dict]:
+    rows = []
+    offset = 0
+    while True:
+        with stage(f"mapping fetch {name} ({offset})") as s:
+            response = session.get(f"{api_url}&offset={offset}&limit={page_size}")
+            response.raise_for_status()
+            page = response.json()
+
+            if 'panes' in page and 'filter' in page['panes'] and 'records' in page['panes']['filter']:
+                records = page['panes']['filter']['records']
+            else:
+                records = []
+            s['rows_out'] = len(records)
+
+        rows.extend({field: record['data'][field] for field in fields} for record in records)
+
+        if len(records) < page_size:
+            return rows
+        offset += page_size
+
+# Fetch all the records of an endpoint over a session of its own (run by the worker threads of get_mapping_api)
+def fetch_endpoint(access_token: str, api_url: str, fields: list[str], name: str = "records") -> list[dict]:
+    with create_session(access_token) as session:
+        return fetch_records(session, api_url, fields, name=name)
+
+def get_mapping_api(client_id: str, tenant_id: str, scopes: list[str], api_gateway: str, access_token: str = None, token_cache_file: str = None)-> MappingTables:
+
+    if access_token is None:
+        access_token = get_access_token(client_id, tenant_id, scopes, token_cache_file)
 
     # print(access_token)
-    api_url_1 = f"{api_gateway}/jobs/filter?fields=jobnumber&restriction=specification4name%20like%20\"Towards2040\"&limit=1000"
-    api_url_2 = f"{api_gateway}/jobs/filter?fields=jobname&restriction=vat%20and%20not(closed)%20and%20not(template)&limit=1000"
-    api_url_3 = f"{api_gateway}/AccountCard/filter?restriction=statistic3%20>%20\"1\"&orderby=accountnumber&fields=accountnumber, statistic3&limit=1000"
+    api_url_1 = f"{api_gateway}/jobs/filter?fields=jobnumber&restriction=specification4name%20like%20\"Towards2040\""
+    api_url_2 = f"{api_gateway}/jobs/filter?fields=jobname&restriction=vat%20and%20not(closed)%20and%20not(template)"
+    api_url_3 = f"{api_gateway}/AccountCard/filter?restriction=statistic3%20>%20\"1\"&orderby=accountnumber&fields=accountnumber, statistic3"
 
     # Room for improvement: Use "jobinvoiceable" from Maconomy to identify invoicable projects
     # Values: non-invoiceable, invoiceable, internal_job, internal_job_invoiceable
 
-    toward = requests.get(api_url_1, headers=headers)
-    vat = requests.get(api_url_2, headers=headers)
-    task = requests.get(api_url_3, headers=headers)   
-
-    towards = toward.json()
-    vats = vat.json()
-    tasks = task.json()
-
-    # Towards 2024 projects
-    if 'panes' in towards and 'filter' in towards['panes'] and 'records' in towards['panes']['filter']:
-        records = towards['panes']['filter']['records']
-        rows = [{'jobnumber': record['data']['jobnumber']} for record in records]
-    else:
-        rows = []
-
-    towards_df = pd.DataFrame(rows, columns=['jobnumber'])
-    # towards_df = pd.DataFrame(rows, columns=['jobnumber', 'specification4name'])
-
-    # Projects with VAT
-    if 'panes' in vats and 'filter' in vats['panes'] and 'records' in vats['panes']['filter']:
-        records = vats['panes']['filter']['records']
-        rows = [{'jobnumber': record['data']['jobnumber']} for record in records]
-    else:
-        rows = []
-
-    vats_df = pd.DataFrame(rows, columns=['jobnumber'])
-
-    # Account to task number mapping
-    if 'panes' in tasks and 'filter' in tasks['panes'] and 'records' in tasks['panes']['filter']:
-        records = tasks['panes']['filter']['records']
-        rows = [{'accountnumber': record['data']['accountnumber'], 'statistic3': record['data']['statistic3']} for record in records]
-    else:
-        rows = []
-
-    tasks_df = pd.DataFrame(rows, columns=['accountnumber', 'statistic3'])
+    # The three endpoints are fetched concurrently, each thread with its own session
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        toward = executor.submit(fetch_endpoint, access_token, api_url_1, ['jobnumber'], name='Towards2040 jobs')
+        vat = executor.submit(fetch_endpoint, access_token, api_url_2, ['jobnumber'], name='VAT jobs')
+        task = executor.submit(fetch_endpoint, access_token, api_url_3, ['accountnumber', 'statistic3'], name='account tasks')
 
-    # Stack the coloumns of the dataframes in one dataframe with the same index
-    df = pd.concat([tasks_df, towards_df, vats_df], axis=1)
-    # rename df columns
-    df.columns = ['Account', 'Task', 'Towards',  'Project_VAT']
+        # Towards 2024 projects
+        towards_df = pd.DataFrame(toward.result(), columns=['jobnumber'])
+        # Projects with VAT
+        vats_df = pd.DataFrame(vat.result(), columns=['jobnumber'])
+        # Account to task number mapping
+        tasks_df = pd.DataFrame(task.result(), columns=['accountnumber', 'statistic3'])
 
-    return df
+    # The account tasks and the job numbers are compiled to the lookup tables used by the conversion (see mapping_tables.py)
+    return compile_mapping(tasks_df['accountnumber'], tasks_df['statistic3'], towards_df['jobnumber'], vats_df['jobnumber'])
 
 if __name__ == "__main__":
     # Just for testing purposes...
-    client_id = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"  
+    client_id = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
     tenant_id = "yyyyyyyy-yyyy-yyyy-yyyy-yyyyyyyyyyyy"
-    scopes = ["api://zzzzzzzz-zzzz-zzzz-zzzz-zzzzzzzzzzzz/.default"] 
+    scopes = ["api://zzzzzzzz-zzzz-zzzz-zzzz-zzzzzzzzzzzz/.default"]
     api_gateway = "https://xyz.azure-api.net/mac"
-    mapping_df = get_mapping_api(client_id, tenant_id, scopes, api_gateway)
-    print(mapping_df)
\ No newline at end of file
+    mapping = get_mapping_api(client_id, tenant_id, scopes, api_gateway)
+    print(mapping)
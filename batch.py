@@ -0,0 +1,140 @@
+#
+# Batch conversion of many HL files (several legal entities and/or back months) in parallel.
+# The mapping is fetched once and shared with the worker processes. One Maconomy journal is written per HL file,
+# plus a summary (batch_summary.csv) of all the files in the output directory.
+#
+# Example: python batch.py --glob "~/Downloads/HLTrans_*.HLT" --orgno 971274190 --from 202501 --to 202506
+import pandas as pd
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from vimpact import convert_ledger, CLIENT_ID, TENANT_ID, SCOPES, API_GATEWAY
+from preprosessing import process_input_files
+from report_reader import read_report
+from maconomy import maconomy_header, write_maconomy_text
+from mapping_cache import get_mapping
+from get_mapping import get_mapping_data
+from mapping_tables import MappingTables, mapping_from_frame
+from hlt_reader import HLT_FILENAME_PATTERN
+from archive import ARCHIVE_DIR, archive_run
+
+# The mapping tables of the worker process (set once by the pool initializer, not sent with every file)
+_mapping: MappingTables = None
+
+def _init_worker(mapping: MappingTables) -> None:
+    global _mapping
+    _mapping = mapping
+
+# Find the HL files matching the glob, filtered on organization numbers and the period range (YYYYMM, inclusive)
+def find_hlt_files(pattern: str, orgnos: list[str] = None, period_from: str = None, period_to: str = None) -> list[tuple[str, str, str]]:
+    files = []
+    for hl_filename in sorted(glob.glob(os.path.expanduser(pattern))):
+        match = HLT_FILENAME_PATTERN.search(os.path.basename(hl_filename))
+        if not match:
+            continue
+        orgno, period = match.groups()
+        if orgnos and orgno not in orgnos:
+            continue
+        if (period_from and period < period_from) or (period_to and period > period_to):
+            continue
+        files.append((hl_filename, orgno, period))
+    return files
+
+# Convert one HL file and write its journal. Runs in a worker process (with the mapping of the worker) or, with mapping, in the caller.
+# With archive_dir the ledger and the journal are also archived under the organization number and period (see archive.py).
+# The status is 'ok', 'invalid' (the ledger did not pass the validation, no journal written) or 'error' (e.g. unreadable input files).
+def convert_file(hl_filename: str, dr_filename: str, output_filename: str, company_number: str, mapping: MappingTables = None,
+                 archive_dir: str = None, validate: bool = True) -> dict:
+    start = time.perf_counter()
+    summary = {'hl_file': hl_filename, 'report_file': dr_filename, 'journal_file': output_filename, 'status': 'ok', 'error': '', 'rows': 0, 'debit': 0.0, 'credit': 0.0}
+    mapping = _mapping if mapping is None else mapping
+    try:
+        # The same steps as vimpact.convert, so unreadable input files and validation errors can be told apart
+        accounting_df = process_input_files(hl_filename, dr_filename, mapping)
+        if accounting_df is None:
+            raise ValueError("The input files could not be read or processed")
+        travel_ids = read_report(dr_filename)['Reiseregning ID'] if validate else None
+        result = convert_ledger(accounting_df, mapping, travel_ids, validate, return_ledger=True)
+        if result is None:
+            summary['status'] = 'invalid'
+            summary['error'] = "The ledger did not pass the validation (see the output of the conversion)"
+        else:
+            ledger_df, maconomy_df = result
+            write_maconomy_text(maconomy_header(company_number), maconomy_df, output_filename)
+            if archive_dir:
+                orgno, period = HLT_FILENAME_PATTERN.search(os.path.basename(hl_filename)).groups()
+                archive_run(ledger_df, maconomy_df, orgno, period, archive_dir)
+            summary['rows'] = len(maconomy_df)
+            summary['debit'] = round(maconomy_df['DebitBase'].sum(), 2)
+            summary['credit'] = round(maconomy_df['CreditBase'].sum(), 2)
+    except Exception as e:
+        summary['status'] = 'error'
+        summary['error'] = str(e)
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    return summary
+
+def run_batch(files: list[tuple[str, str, str]], mapping: MappingTables, output_dir: str, report_template: str = "Transaksjoner, detaljert.xlsx",
+              companies: dict[str, str] = None, workers: int = None, archive_dir: str = None, validate: bool = True) -> pd.DataFrame:
+    os.makedirs(output_dir, exist_ok=True)
+    companies = companies or {}
+
+    jobs = []
+    for hl_filename, orgno, period in files:
+        # The report file name may contain {orgno} and {period}. Relative names are looked up next to the HL file.
+        dr_filename = os.path.join(os.path.dirname(hl_filename), os.path.expanduser(report_template.format(orgno=orgno, period=period)))
+        output_filename = os.path.join(output_dir, f"Maconomy_{orgno}_{period}.txt")
+        jobs.append((hl_filename, dr_filename, output_filename, companies.get(orgno, '1'), None, archive_dir, validate))
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(mapping,)) as executor:
+        futures = [executor.submit(convert_file, *job) for job in jobs]
+        for future in as_completed(futures):
+            summary = future.result()
+            color = "\033[95m" if summary['status'] == 'ok' else "\033[91m"
+            print(f"{color}{summary['hl_file']}: {summary['status']} {summary['error']}\033[0m")
+            summaries.append(summary)
+
+    summary_df = pd.DataFrame(summaries).sort_values('hl_file', ignore_index=True)
+    summary_df.to_csv(os.path.join(output_dir, "batch_summary.csv"), index=False)
+    return summary_df
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert many Visma HL files to Maconomy journals in parallel.")
+    parser.add_argument("--glob", default=os.path.join("~", "Downloads", "HLTrans_*.HLT"), help="Glob pattern of the HL files")
+    parser.add_argument("--orgno", nargs="*", help="Only convert these organization numbers")
+    parser.add_argument("--from", dest="period_from", help="First period (YYYYMM)")
+    parser.add_argument("--to", dest="period_to", help="Last period (YYYYMM)")
+    parser.add_argument("--report", default="Transaksjoner, detaljert.xlsx", help="Payroll report file name, may contain {orgno} and {period}")
+    parser.add_argument("--company", nargs="*", default=[], help="Maconomy company number per organization number as ORGNO=COMPANY (default 1)")
+    parser.add_argument("--output-dir", default=".", help="Directory of the journals and batch_summary.csv")
+    parser.add_argument("--mapping-file", help="Use this mapping Excel file instead of the Maconomy API")
+    parser.add_argument("--refresh-mapping", action="store_true", help="Download the mapping even if the cached mapping is fresh")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--skip-validation", action="store_true", help="Write the journals even if the ledgers don't pass the validation (see validation.py)")
+    parser.add_argument("--archive", nargs="?", const=ARCHIVE_DIR, metavar="DIR", help=f"Archive the ledgers and journals (default {ARCHIVE_DIR}, see archive.py)")
+    args = parser.parse_args()
+
+    files = find_hlt_files(args.glob, args.orgno, args.period_from, args.period_to)
+    if not files:
+        print(f"\033[91mNo HL files found for {args.glob}.\033[0m")
+        return
+
+    # The mapping is fetched once for all the files
+    if args.mapping_file:
+        mapping_df = get_mapping_data(args.mapping_file)
+        mapping = mapping_from_frame(mapping_df) if mapping_df is not None else None
+    else:
+        mapping = get_mapping(CLIENT_ID, TENANT_ID, SCOPES, API_GATEWAY, refresh=args.refresh_mapping)
+    if mapping is None:
+        print(f"\033[91mNo mapping data, nothing is converted.\033[0m")
+        return
+
+    companies = dict(company.split("=", 1) for company in args.company)
+    summary_df = run_batch(files, mapping, args.output_dir, args.report, companies, args.workers,
+                           os.path.expanduser(args.archive) if args.archive else None, not args.skip_validation)
+    print(summary_df.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
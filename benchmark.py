@@ -0,0 +1,97 @@
+#
+# Benchmark of the conversion stages of vimpact.main on synthetic data (see synthetic_data.py), offline.
+# The mapping API is stubbed with the content of mapping.xlsx in the format returned by the API (strings).
+# The 1k journal is compared with the stored golden journal (benchmark_golden_1k.txt) to check that the output is unchanged.
+#
+# Example: python benchmark.py --sizes 1000 100000 1000000
+#          python benchmark.py --update-golden    (after an intended change of the output)
+import argparse
+import os
+import sys
+import pandas as pd
+from get_mapping import get_mapping_data
+from mapping_tables import MappingTables, mapping_from_frame
+from maconomy import maconomy_header, write_maconomy_text
+from profiling import stage, enable_profiling, disable_profiling, print_profile, profile_records
+from synthetic_data import generate, ACCOUNTS
+from vimpact import convert
+
+GOLDEN_SIZE = 1000
+GOLDEN_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_golden_1k.txt")
+
+# Stub of azure_auth.get_mapping_api: the mapping Excel file with the columns as strings, like the API returns them, compiled to the lookup tables
+def get_mapping_api_stub(mp_filename: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mapping.xlsx")) -> MappingTables:
+    mapping_df = get_mapping_data(mp_filename)
+    # The accounts of the synthetic data that are not in mapping.xlsx get task 80, so the journal passes the validation
+    missing = [account for account in ACCOUNTS if account not in set(mapping_df['Account'])]
+    mapping_df = pd.concat([mapping_df, pd.DataFrame({'Account': missing, 'Task': 80})], ignore_index=True)
+    for column in mapping_df.columns:
+        mapping_df[column] = mapping_df[column].astype(str).where(mapping_df[column].astype(str) != 'nan')
+    return mapping_from_frame(mapping_df)
+
+# Returns the journal file and the stage measurements. The journal file is None if the conversion failed.
+def run_benchmark(size: int, data_dir: str, trace_memory: bool = False) -> tuple[str, list[dict]]:
+    # The synthetic files are generated once per size and reused
+    size_dir = os.path.join(data_dir, str(size))
+    hl_filename = os.path.join(size_dir, "HLTrans_971274190_202507.HLT")
+    dr_filename = os.path.join(size_dir, "Transaksjoner, detaljert.xlsx")
+    if not (os.path.exists(hl_filename) and os.path.exists(dr_filename)):
+        generate(size_dir, size)
+
+    enable_profiling(trace_memory)
+    with stage("mapping (stub)") as s:
+        mapping = get_mapping_api_stub()
+        s['rows_out'] = len(mapping.accounts)
+
+    # The report cache is not used, so the report read is timed on every run
+    maconomy_df = convert(hl_filename, dr_filename, mapping, report_cache_dir=None)
+
+    output_filename = None
+    if maconomy_df is not None:
+        output_filename = os.path.join(size_dir, "out.txt")
+        with stage("output write out.txt", rows_in=len(maconomy_df)):
+            write_maconomy_text(maconomy_header(), maconomy_df, output_filename)
+
+    records = profile_records()
+    disable_profiling()
+    return output_filename, records
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the conversion stages on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 100000], help="Numbers of HL lines (e.g. 1000 100000 1000000)")
+    parser.add_argument("--data-dir", default="bench_data", help="Directory of the generated files")
+    parser.add_argument("--memory", action="store_true", help="Also measure the peak memory (slower)")
+    parser.add_argument("--update-golden", action="store_true", help="Replace the golden journal with the current output")
+    args = parser.parse_args()
+
+    # The golden check always runs, on the 1k data set
+    sizes = [GOLDEN_SIZE] + [size for size in args.sizes if size != GOLDEN_SIZE]
+    results = []
+    for size in sizes:
+        output_filename, records = run_benchmark(size, args.data_dir, args.memory)
+        if output_filename is None:
+            print(f"\033[91mThe conversion of the {size} lines data set failed (unreadable input files or the ledger did not pass the validation), see above.\033[0m")
+            return 1
+        print(f"\n\033[96m{size} HL lines\033[0m")
+        print_profile()
+        results += [{'lines': size, **record} for record in records]
+
+        if size == GOLDEN_SIZE:
+            with open(output_filename, 'rb') as f:
+                journal = f.read()
+            if args.update_golden:
+                with open(GOLDEN_FILENAME, 'wb') as f:
+                    f.write(journal)
+                print(f"\033[93mThe golden journal {GOLDEN_FILENAME} was updated.\033[0m")
+            else:
+                with open(GOLDEN_FILENAME, 'rb') as f:
+                    if f.read() != journal:
+                        print(f"\033[91mThe journal differs from the golden journal {GOLDEN_FILENAME} ({output_filename}).\033[0m")
+                        return 1
+                print(f"\033[92mThe journal matches the golden journal.\033[0m")
+
+    print("\n" + pd.DataFrame(results).pivot_table(index='stage', columns='lines', values='seconds', sort=False).to_string())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
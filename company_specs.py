@@ -1,118 +1,78 @@
 import pandas as pd
+import numpy as np
 import os
 import warnings
+from ledger_schema import apply_ledger_schema
+from mapping_tables import MappingTables
+
+# Account rules for invoicable projects (Project>30000, not Towards2040).
+# Each rule covers the accounts start <= Konto < stop (like range(start, stop)) for transactions dated valid_from..valid_to.
+# A rule without a credit account replaces Konto with the debit account (same same but different).
+# A rule with a credit account keeps the transaction and adds a credit on the credit account and a debit on the debit account.
+ACCOUNT_RULES = [
+    # start, stop, credit, debit, valid_from,   valid_to
+    (5000,   5299, None,   4753,  None,         None),
+    (5330,   5549, None,   4753,  None,         None),
+    (5600,   5998, None,   4753,  None,         None),
+    (5300,   5329, 5399,   4755,  None,         None),          # Debit debit credit 5300-5329
+    (5550,   5598, 5599,   4755,  None,         None),          # Debit debit credit 5550-5598 (not 5599)
+    (6000,   6998, None,   4756,  None,         "2025-06-11"),
+    (6000,   6998, 6999,   4756,  "2025-06-12", None),          # New logic valid from 12.06.2025
+    (7000,   7998, 7199,   4757,  None,         None),
+]
 
 # Function to create CICERO specific debit/crecit transaction for proper accounting practises
-def company_specific_transactions(input_df_hldf: pd.DataFrame, input_df_mapping: pd.DataFrame) -> pd.DataFrame:   
+def company_specific_transactions(input_df_hldf: pd.DataFrame, mapping: MappingTables) -> pd.DataFrame:
     print(f"\033[96mProcessing CICERO specific transactions...\033[0m")
 
     # The creation of debit/credit entries to reflect invoiced expenses vs. non-invoiced expenses in the general ledger.
-    # The new debit/credit entries are applied on invoicable project (Project>30000) 
+    # The new debit/credit entries are applied on invoicable project (Project>30000)
     # There are special debit/credit entries for Towards2040 projects (listed in the mapping file)
     # The VAT handling is also considered in the new debit/credit entries.
-    
-    # Extracting the Towards2040 projects (df_towards).
-    df_towards = input_df_mapping.iloc[:, [2]].dropna(subset=[input_df_mapping.columns[2]])
-    # Extracting the projects with VAT handeling (df_VAT).
-    df_VAT = input_df_mapping.iloc[:, [3]].dropna(subset=[input_df_mapping.columns[3]])
 
-    # print(df_towards)   
-   
-    # print(df_VAT)
+    # The Towards2040 projects (df_towards) and the projects with VAT handeling (df_VAT) from the compiled mapping.
+    df_towards = mapping.towards
+    df_VAT = mapping.vat_projects
+
+    # Deleting VAT codes from non VAT projects (on a copy, the input DataFrame is left as it is)
+    input_df_hldf = input_df_hldf.assign(MVA=input_df_hldf['MVA'].where(input_df_hldf['Prosjekt'].isin(df_VAT).to_numpy(dtype=bool), 0))
 
-    # print(input_df_hldf)
+    # Invoicable projects (not Towards2040 projects)
+    # Room for improvement: Use "jobinvoiceable" from Maconomy to identify invoicable projects
+    # Values: non-invoiceable, invoiceable, internal_job, internal_job_invoiceable
+    invoicable = ((input_df_hldf['Prosjekt'] > 30000) & ~input_df_hldf['Prosjekt'].isin(df_towards)).fillna(False).to_numpy(dtype=bool)
 
-    # print("Hello nurce!")
-       
-    new_rows = []
+    konto = input_df_hldf['Konto'].to_numpy()
+    dato = input_df_hldf['Dato'].to_numpy()
+    credit_account = np.zeros(len(input_df_hldf), dtype=np.int64)
+    debit_account = np.zeros(len(input_df_hldf), dtype=np.int64)
 
-    # Ivoicable projects (>30000) 
-    # 5000-5998: Debit 4753, Kredit 5999
-    # 6000-6998: Debit 4753, Kredit 6XXX
-    # 7000-7998: Debit 4753, Kredit 7999
-     
-    # Loop through the DataFrame and create the new debit/credit entries
-    for index, row in input_df_hldf.iterrows():
+    # Match every transaction against the account ranges of the rules (first matching rule wins).
+    for start, stop, credit, debit, valid_from, valid_to in ACCOUNT_RULES:
+        match = invoicable & (konto >= start) & (konto < stop) & (debit_account == 0)
+        if valid_from is not None:
+            match &= dato >= np.datetime64(valid_from)
+        if valid_to is not None:
+            match &= dato <= np.datetime64(valid_to)
+        credit_account[match] = credit or 0
+        debit_account[match] = debit
 
-        # Deleting VAT codes from non VAT projects
-        if (row['Prosjekt']) not in df_VAT['Project_VAT'].values:   
-            input_df_hldf.at[index, 'MVA'] = 0 
-            row['MVA'] = 0
+    # Replace konto/aktivitet on the rules without an offset credit
+    replace = (debit_account > 0) & (credit_account == 0)
+    input_df_hldf.loc[replace, 'Konto'] = debit_account[replace]
 
-        # Invoicable projects (not Towards2040 projects)
-        # Room for improvement: Use "jobinvoiceable" from Maconomy to identify invoicable projects
-        # Values: non-invoiceable, invoiceable, internal_job, internal_job_invoiceable
-        # astype(int).values
-        if (row['Prosjekt']) > "30000" and (row['Prosjekt']) not in df_towards['Towards'].values:
-            # Credit trans
+    # Debit debit credit: credit first, then the debit transaction, for each of the matched transactions
+    split = credit_account > 0
+    credit_rows = input_df_hldf.loc[split].copy()
+    credit_rows['Konto'] = credit_account[split]
+    credit_rows['Beløp'] = -credit_rows['Beløp']
+    debit_rows = input_df_hldf.loc[split].copy()
+    debit_rows['Konto'] = debit_account[split]
 
-            if int(row['Konto']) in range(5000, 5299) or int(row['Konto']) in range(5330, 5549) or int(row['Konto']) in range(5600, 5998):
-                # Same same but different (erstatter vi konto/aktivitet med 4753)
-                input_df_hldf.at[index, 'Konto'] = 4753                
-            elif int(row['Konto']) in range(5300, 5329):
-                # Debit debit credit 5300-5329
-                # credit first...
-                new_row_1 = row.copy()
-                new_row_1['Konto'] = 5399
-                new_row_1['Beløp'] = -row['Beløp']
-                new_rows.append(new_row_1)
+    n = len(credit_rows)
+    new_rows = pd.concat([credit_rows, debit_rows], ignore_index=True).take(np.arange(2 * n).reshape(2, n).T.ravel())
 
-                # Debit trans on account 4755
-                new_row_2 = row.copy()
-                new_row_2['Konto'] = 4755
-                new_row_2['Beløp'] = row['Beløp']
-                new_rows.append(new_row_2)
-            elif int(row['Konto']) in range(5550, 5598):
-                # Debit debit credit 5550-5598 (not 5599)
-                # credit first...
-                new_row_1 = row.copy()
-                new_row_1['Konto'] = 5599
-                new_row_1['Beløp'] = -row['Beløp']
-                new_rows.append(new_row_1)
+    # Insert the new rows into hldf
+    df_addded_transactions = apply_ledger_schema(pd.concat([input_df_hldf, new_rows], ignore_index=True))
 
-                # Debit trans on account 4755
-                new_row_2 = row.copy()
-                new_row_2['Konto'] = 4755
-                new_row_2['Beløp'] = row['Beløp']
-                new_rows.append(new_row_2)
-           # elif int(row['Konto']) in range(6000, 6998):
-           #      input_df_hldf.at[index, 'Konto'] = 4756 
-           #
-           # New logic valid from 12.06.2025
-            elif int(row['Konto']) in range(6000, 6998):
-                # Debit debit credit
-                # credit first...
-                new_row_1 = row.copy()
-                new_row_1['Konto'] = 6999
-                new_row_1['Beløp'] = -row['Beløp']
-                new_rows.append(new_row_1)    
-     
-                # Debit trans on account 4756
-                new_row_2 = row.copy()
-                new_row_2['Konto'] = 4756
-                new_row_2['Beløp'] = row['Beløp']
-                new_rows.append(new_row_2)
-                
-            elif int(row['Konto']) in range(7000, 7998):
-                # Debit debit credit
-                # credit first...
-                new_row_1 = row.copy()
-                new_row_1['Konto'] = 7199
-                new_row_1['Beløp'] = -row['Beløp']
-                new_rows.append(new_row_1)    
-     
-                # Debit trans on account 4757
-                new_row_2 = row.copy()
-                new_row_2['Konto'] = 4757
-                new_row_2['Beløp'] = row['Beløp']
-                new_rows.append(new_row_2)
-           # elif int(row['Konto']) in range(7170, 7998):
-                # Same same but different
-           #     input_df_hldf.at[index, 'Konto'] = 4757 
-         
-       
-        # Insert the new rows into hldf
-        if new_rows:
-            df_addded_transactions = pd.concat([input_df_hldf, pd.DataFrame(new_rows)], ignore_index=True)
-        
-    return df_addded_transactions
\ No newline at end of file
+    return df_addded_transactions
@@ -0,0 +1,109 @@
+#
+# Incremental export: a local SQLite state store of the HL lines that have been exported to Maconomy.
+# Every HL line is identified by a hash of its content (account, VAT, department, project, employee, ID, date and amount)
+# plus a counter for identical lines. A re-run of the same month then only converts the new (or changed) lines, and can
+# reverse the exported lines that have disappeared from the HL file.
+#
+# The state is only updated with commit_export() after the journal has been written.
+import pandas as pd
+import numpy as np
+import os
+import sqlite3
+from datetime import datetime
+from ledger_schema import apply_ledger_schema
+from hlt_reader import HLT_FILENAME_PATTERN
+
+STATE_DB = os.path.join(os.path.expanduser("~"), ".vimpact", "export_state.sqlite")
+
+# The content of an HL line used for the hash
+HASH_COLUMNS = ['Konto', 'MVA', 'Avdeling', 'Prosjekt', 'Medarbeider', 'ID', 'Dato', 'Beløp']
+# The ledger columns stored for the exported lines, so disappeared lines can be reversed
+STORED_COLUMNS = ['Konto', 'MVA', 'Avdeling', 'Prosjekt', 'Oppgave', 'Medarbeider', 'ID', 'Dato', 'Beløp', 'Text']
+
+def open_state(state_db: str = STATE_DB) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(state_db)), exist_ok=True)
+    con = sqlite3.connect(state_db)
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT, hl_file TEXT, finished TEXT, rows_new INTEGER, rows_reversed INTEGER);
+        CREATE TABLE IF NOT EXISTS exported (
+            scope TEXT, hash INTEGER, occurrence INTEGER, run_id INTEGER,
+            Konto INTEGER, MVA INTEGER, Avdeling INTEGER, Prosjekt INTEGER, Oppgave TEXT, Medarbeider INTEGER, ID INTEGER,
+            Dato TEXT, Beløp INTEGER, Text TEXT,
+            PRIMARY KEY (scope, hash, occurrence));
+    """)
+    return con
+
+# The scope of the state is the organization number and period of the HL file (HLTrans_<orgno>_<YYYYMM>.HLT),
+# so re-exports of the same month share their state.
+def export_scope(hl_filename: str) -> str:
+    match = HLT_FILENAME_PATTERN.search(os.path.basename(hl_filename))
+    return f"{match.group(1)}_{match.group(2)}" if match else os.path.splitext(os.path.basename(hl_filename))[0]
+
+# Content hash (as signed int64, like SQLite integers) and occurrence number of every line of the ledger
+def line_keys(accounting_df: pd.DataFrame) -> pd.DataFrame:
+    content = pd.DataFrame({column: accounting_df[column].astype('Int64' if column != 'Dato' else 'datetime64[ns]') for column in HASH_COLUMNS})
+    content['Dato'] = content['Dato'].astype('int64')
+    content = content.fillna(0).astype('int64')
+    hashes = pd.util.hash_pandas_object(content, index=False).to_numpy().view(np.int64)
+    keys = pd.DataFrame({'hash': hashes}, index=accounting_df.index)
+    keys['occurrence'] = keys.groupby('hash').cumcount()
+    return keys
+
+# Split the ledger in the lines that are not exported yet, and (with reverse_missing) the reversal of the exported lines
+# that are no longer in the HL file. Returns the ledger to convert and the pending state change for commit_export().
+# Without reverse_missing, a run with both new lines and exported lines that are no longer in the HL file (changed lines) is
+# stopped and (None, None) is returned, since the new version of a changed line would be booked next to the old version.
+def select_new_transactions(con: sqlite3.Connection, scope: str, accounting_df: pd.DataFrame, reverse_missing: bool = False) -> tuple[pd.DataFrame, dict]:
+    keys = line_keys(accounting_df)
+    exported = pd.read_sql_query("SELECT hash, occurrence FROM exported WHERE scope = ?", con, params=(scope,))
+
+    # Hash join of the current lines with the exported lines
+    joined = keys.reset_index().merge(exported, on=['hash', 'occurrence'], how='outer', indicator=True)
+    new_keys = joined[joined['_merge'] == 'left_only'].set_index('index')[['hash', 'occurrence']].sort_index()
+    missing_keys = joined[joined['_merge'] == 'right_only'][['hash', 'occurrence']]
+
+    new_df = accounting_df.loc[new_keys.index.astype(accounting_df.index.dtype)]
+    print(f"\033[92mIncremental export: {len(new_df)} new lines, {len(accounting_df) - len(new_df)} already exported, {len(missing_keys)} exported lines no longer in the HL file.\033[0m")
+
+    if not reverse_missing and len(missing_keys) > 0 and len(new_df) > 0:
+        print(f"\033[91mThe HL file has {len(new_df)} new lines and {len(missing_keys)} exported lines are no longer in it, so lines have probably been changed. "
+              f"Nothing is exported, since the old versions would stay booked next to the new ones. Run with --reverse-missing to reverse the old versions.\033[0m")
+        return None, None
+
+    reversed_df = accounting_df.iloc[0:0]
+    if reverse_missing and len(missing_keys) > 0:
+        stored = pd.read_sql_query("SELECT * FROM exported WHERE scope = ?", con, params=(scope,)).merge(missing_keys, on=['hash', 'occurrence'])
+        reversed_df = stored[STORED_COLUMNS].copy()
+        reversed_df['Dato'] = pd.to_datetime(reversed_df['Dato'])
+        reversed_df['Oppgave'] = reversed_df['Oppgave'].astype(object).where(reversed_df['Oppgave'].notna())
+        reversed_df = apply_ledger_schema(reversed_df)
+        # The reversal is the exported line with the opposite amount
+        reversed_df['Beløp'] = -reversed_df['Beløp']
+        reversed_df['Text'] = 'Reversering: ' + reversed_df['Text'].astype(str)
+
+    pending = {'scope': scope, 'new_df': new_df, 'new_keys': new_keys, 'reversed_keys': missing_keys if reverse_missing else missing_keys.iloc[0:0]}
+    # Only the non-empty parts are concatenated (concat with empty frames is deprecated in pandas)
+    parts = [df for df in (new_df, reversed_df) if len(df) > 0]
+    delta_df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else (parts[0] if parts else new_df).reset_index(drop=True)
+    return apply_ledger_schema(delta_df), pending
+
+# Record the exported lines (and remove the reversed lines) after the journal has been written
+def commit_export(con: sqlite3.Connection, pending: dict, hl_filename: str) -> None:
+    new_df = pending['new_df']
+    with con:
+        cursor = con.execute("INSERT INTO runs (scope, hl_file, finished, rows_new, rows_reversed) VALUES (?, ?, ?, ?, ?)",
+                             (pending['scope'], hl_filename, datetime.now().isoformat(timespec='seconds'), len(new_df), len(pending['reversed_keys'])))
+        run_id = cursor.lastrowid
+
+        rows = new_df[STORED_COLUMNS].astype(object).where(new_df[STORED_COLUMNS].notna(), None)
+        rows['Dato'] = new_df['Dato'].dt.strftime('%Y-%m-%d')
+        rows.insert(0, 'run_id', run_id)
+        rows.insert(0, 'occurrence', pending['new_keys']['occurrence'].to_numpy())
+        rows.insert(0, 'hash', pending['new_keys']['hash'].to_numpy())
+        rows.insert(0, 'scope', pending['scope'])
+        con.executemany(f"INSERT OR REPLACE INTO exported (scope, hash, occurrence, run_id, {', '.join(STORED_COLUMNS)}) VALUES ({', '.join('?' * (len(STORED_COLUMNS) + 4))})",
+                        (tuple(int(v) if isinstance(v, np.integer) else v for v in row) for row in rows.itertuples(index=False)))
+
+        con.executemany("DELETE FROM exported WHERE scope = ? AND hash = ? AND occurrence = ?",
+                        ((pending['scope'], int(h), int(o)) for h, o in pending['reversed_keys'].itertuples(index=False)))
@@ -0,0 +1,108 @@
+#
+# Fast reader for the fixed-width Visma Payroll accounting file (HLTrans_<orgno>_<YYYYMM>.HLT).
+# The file is memory-mapped and only the needed fields are sliced from the bytes. Numbers are decoded directly
+# to integers (amounts in øre) and dates to datetime64, without pandas type inference or string round trips.
+import pandas as pd
+import numpy as np
+import mmap
+import os
+import re
+
+# The fields used from the HL file: name -> (start, stop) byte positions (same colspecs as the full record layout)
+# Full layout: Konto, MVA, Avdeling, Prosjekt, Medarbeider, R4, R5, R6, R7, ID, Filler, Dato, Ant, Sats, Beløp (sign first)
+HLT_FIELDS = {
+    'Konto':       (0, 12),
+    'MVA':         (12, 14),
+    'Avdeling':    (14, 26),
+    'Prosjekt':    (26, 38),
+    'Medarbeider': (38, 50),
+    'ID':          (98, 118),
+    'Dato':        (121, 129),
+    'Beløp':       (149, 160),
+}
+HLT_RECORD_LENGTH = 160
+
+# HLTrans_<orgno>_<YYYYMM>.HLT
+HLT_FILENAME_PATTERN = re.compile(r"HLTrans_(\d+)_(\d{6})\.HLT$", re.IGNORECASE)
+
+# Decode a block of fixed-width digit fields (one row per record) to int64. Leading blanks and a leading sign are allowed.
+# first_line is the line number of the first row in the file (for the error messages).
+def _decode_integers(block: np.ndarray, name: str, first_line: int = 1) -> np.ndarray:
+    # Digits beyond what int64 can hold must be leading zeros or blanks
+    width = block.shape[1]
+    if width > 18:
+        leading = block[:, :width - 18]
+        too_large = ~np.isin(leading, (ord('0'), ord(' '))).all(axis=1)
+        if too_large.any():
+            raise ValueError(f"The field {name} has values that are too large (line {first_line + int(np.argmax(too_large))})")
+        block = block[:, width - 18:]
+        width = 18
+
+    negative = (block == ord('-')).any(axis=1)
+    digits = block.astype(np.int64) - ord('0')
+    blank = np.isin(block, (ord(' '), ord('+'), ord('-')))
+    non_numeric = ~((digits >= 0) & (digits <= 9) | blank).all(axis=1)
+    if non_numeric.any():
+        raise ValueError(f"The field {name} has non-numeric values (line {first_line + int(np.argmax(non_numeric))})")
+    digits[blank] = 0
+
+    values = digits @ (10 ** np.arange(width - 1, -1, -1, dtype=np.int64))
+    return np.where(negative, -values, values)
+
+# Decode a block of ddmmyyyy date fields to datetime64. Blank or invalid dates become NaT.
+def _decode_dates(block: np.ndarray, name: str, first_line: int = 1) -> np.ndarray:
+    ddmmyyyy = _decode_integers(block, name, first_line)
+    return pd.to_datetime(pd.DataFrame({'year': ddmmyyyy % 10000, 'month': ddmmyyyy // 10000 % 100, 'day': ddmmyyyy // 1000000}), errors='coerce').to_numpy()
+
+def _decode_records(records: np.ndarray, first_line: int = 1) -> pd.DataFrame:
+    columns = {}
+    for name, (start, stop) in HLT_FIELDS.items():
+        if name == 'Dato':
+            columns[name] = _decode_dates(records[:, start:stop], name, first_line)
+        else:
+            columns[name] = _decode_integers(records[:, start:stop], name, first_line)
+    return pd.DataFrame(columns)
+
+# Decode the records start..stop of the memory map. The records are copied out of the map (mm[a:b]), so no array refers to
+# the map when it is closed (also when a record is malformed and an error is raised).
+def _decode_buffer(mm: mmap.mmap, start: int, stop: int, record_length: int, line_ending: bytes, hl_filename: str) -> pd.DataFrame:
+    records = np.frombuffer(mm[start * record_length:stop * record_length], dtype=np.uint8).reshape(-1, record_length)
+    # Every record must end with the line ending at the same position as the first record (lines of the same length)
+    misaligned = (records[:, record_length - len(line_ending):] != np.frombuffer(line_ending, dtype=np.uint8)).any(axis=1)
+    if misaligned.any():
+        line = start + int(np.argmax(misaligned)) + 1
+        raise ValueError(f"Line {line} of {hl_filename} does not have the length of the first line ({record_length - len(line_ending)} characters)")
+    return _decode_records(records, start + 1)
+
+# Read the HL file in chunks of chunksize records. Only one chunk of decoded fields is held in memory at a time.
+# All the lines must have the same length (fixed-width records), otherwise a ValueError with the line number is raised.
+def iter_hlt(hl_filename: str, chunksize: int = 100000):
+    with open(hl_filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Record length including the line ending (\n or \r\n)
+            newline = mm.find(b'\n')
+            record_length = newline + 1 if newline >= 0 else len(mm)
+            line_ending = b'\r\n' if newline > 0 and mm[newline - 1:newline] == b'\r' else b'\n' if newline >= 0 else b''
+            if record_length - len(line_ending) < HLT_RECORD_LENGTH:
+                raise ValueError(f"The records in {hl_filename} are shorter than {HLT_RECORD_LENGTH} characters")
+
+            count = len(mm) // record_length
+            for start in range(0, count, chunksize):
+                yield _decode_buffer(mm, start, min(start + chunksize, count), record_length, line_ending, hl_filename)
+
+            # The last record may come without line ending, anything else after the last full record is an irregular line
+            last = mm[count * record_length:].rstrip(b'\r\n\x1a')
+            if last.strip():
+                if len(last) != record_length - len(line_ending):
+                    raise ValueError(f"Line {count + 1} of {hl_filename} does not have the length of the first line ({record_length - len(line_ending)} characters)")
+                yield _decode_records(np.frombuffer(last + line_ending, dtype=np.uint8).reshape(1, -1), count + 1)
+
+# Read the whole HL file into one DataFrame with the columns Konto, MVA, Avdeling, Prosjekt, Medarbeider, ID (int64),
+# Dato (datetime64) and Beløp (int64, øre).
+def read_hlt(hl_filename: str, chunksize: int = 100000) -> pd.DataFrame:
+    chunks = list(iter_hlt(hl_filename, chunksize))
+    if not chunks:
+        return _decode_records(np.empty((0, HLT_RECORD_LENGTH), dtype=np.uint8))
+    return pd.concat(chunks, ignore_index=True)
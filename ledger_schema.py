@@ -0,0 +1,29 @@
+#
+# The typed schema of the ledger DataFrame used by preprosessing, company_specs and maconomy.
+# Accounts, projects and travel IDs are integers, departments, tasks and employees are categories,
+# amounts are int64 øre and missing values are NA/NaN (not empty strings).
+import pandas as pd
+
+LEDGER_SCHEMA = {
+    'Konto':       'int64',
+    'MVA':         'int16',
+    'Avdeling':    'category',
+    'Prosjekt':    'Int64',
+    'Oppgave':     'category',
+    'Medarbeider': 'category',
+    'ID':          'Int64',
+    'Dato':        'datetime64[ns]',
+    'Beløp':       'int64',
+    'Text':        'object',
+}
+
+# Cast the ledger columns to the schema types (columns not in the schema are left as they are)
+def apply_ledger_schema(df: pd.DataFrame) -> pd.DataFrame:
+    # Department and employee numbers that became decimals because of missing values (e.g. after a concat) are made integers again
+    decimals = {column: 'Int64' for column, dtype in LEDGER_SCHEMA.items() if column in df.columns and dtype == 'category' and pd.api.types.is_float_dtype(df[column])}
+    return df.astype(decimals).astype({column: dtype for column, dtype in LEDGER_SCHEMA.items() if column in df.columns})
+
+# Numeric values of a mapping column (accounts, project numbers), with the empty cells left out.
+# The mapping from the API has strings and the mapping Excel file numbers or strings with decimals.
+def mapping_numbers(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values, errors='coerce').dropna().astype('int64')
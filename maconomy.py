@@ -6,22 +6,95 @@ import warnings
 def transform_to_maconomy(input_df_hldf: pd.DataFrame) -> pd.DataFrame:
     print(f"\033[93mTransforming the data to Maconomy format...\033[0m")
 
-    # Building the Maconomy import file from the hldf DataFrame.
-    df_macloc = pd.DataFrame(columns=['GeneralJournal:Format','TransactionNumber', 'EntryDate', 'EntryText', 'TypeOfEntry', 'AccountNumber', 'FinanceVATCode', 'DebitBase', 'CreditBase','EntityName','JobNumber','TaskName','ActivityNumber','EmployeeNumber'])    
-    df_macloc['EntryDate'] = input_df_hldf['Dato'].dt.strftime('%d/%m/%Y')
-    df_macloc['EntryText'] = input_df_hldf.apply(lambda row: row['Text'] if isinstance(row['Text'], str) else None, axis=1)
-    df_macloc['TypeOfEntry'] = 'G'
-    
-    df_macloc['AccountNumber'] = input_df_hldf.apply(lambda row: row['Konto'] if row['Prosjekt'] =="" else None, axis=1)
-    df_macloc['FinanceVATCode'] = input_df_hldf.apply(lambda row: row['MVA'] if row['MVA'] > 0 else None, axis=1)
-    df_macloc['DebitBase'] = input_df_hldf.apply(lambda row: row['Beløp'] if row['Beløp'] > 0 else None, axis=1)
-    df_macloc['CreditBase'] = input_df_hldf.apply(lambda row: abs(row['Beløp']) if row['Beløp'] < 0 else None, axis=1)
-    df_macloc['EntityName'] = input_df_hldf.apply(lambda row: row['Avdeling'] if isinstance(row['Avdeling'], str) else None, axis=1)
-    df_macloc['ActivityNumber'] = input_df_hldf.apply(lambda row: row['Konto'] if row['Prosjekt'] > "1" else None, axis=1)
-    df_macloc['JobNumber'] = input_df_hldf.apply(lambda row: row['Prosjekt'] if row['Prosjekt'] > "0" else None, axis=1)
-    df_macloc['EmployeeNumber'] = input_df_hldf.apply(lambda row: row['Medarbeider'] if row['Medarbeider'] != '0' else None, axis=1)
-    df_macloc['TaskName'] = input_df_hldf.apply(lambda row: row['Oppgave'] if row['Oppgave'] else None, axis=1)
-    df_macloc['GeneralJournal:Format'] = 'GENERALJOURNAL:CREATE'
-    df_macloc['TransactionNumber'] = '#KEEP'
+    # Building the Maconomy import file from the hldf DataFrame (typed as in ledger_schema.py, missing values are NA).
+    # Every column is built with column operations (where/mask) and the frame is constructed in one go.
+    prosjekt = input_df_hldf['Prosjekt']
+    konto = input_df_hldf['Konto'].astype('Int64')
+    mva = input_df_hldf['MVA'].astype('Int64')
+    # Beløp is in øre, Maconomy wants kroner
+    belop = input_df_hldf['Beløp'] / 100
+
+    df_macloc = pd.DataFrame({
+        'GeneralJournal:Format': 'GENERALJOURNAL:CREATE',
+        'TransactionNumber': '#KEEP',
+        'EntryDate': input_df_hldf['Dato'].dt.strftime('%d/%m/%Y'),
+        'EntryText': input_df_hldf['Text'],
+        'TypeOfEntry': 'G',
+        'AccountNumber': konto.where(prosjekt.isna()),
+        'FinanceVATCode': mva.where(mva > 0),
+        'DebitBase': belop.where(belop > 0),
+        'CreditBase': belop.abs().where(belop < 0),
+        'EntityName': input_df_hldf['Avdeling'],
+        'JobNumber': prosjekt.where((prosjekt > 0).fillna(False)),
+        'TaskName': input_df_hldf['Oppgave'],
+        'ActivityNumber': konto.where((prosjekt > 1).fillna(False)),
+        'EmployeeNumber': input_df_hldf['Medarbeider'],
+    }, index=input_df_hldf.index)
 
     return df_macloc
+
+# The journal header of the Maconomy import file (static, except for the Maconomy company number)
+def maconomy_header(company_number: str = '1') -> pd.DataFrame:
+    return pd.DataFrame({
+        'Column1': ['JOURNAL:Format','JOURNAL:CREATE'],
+        'Column2': ['TransactionNumberSeries','Lønn'],
+        'Column3': ['CompanyNumber', company_number]
+    })
+
+# Format the journal columns as text for the Maconomy import file (amounts with two decimals, empty cells for missing values).
+def format_maconomy_columns(df_macloc: pd.DataFrame) -> pd.DataFrame:
+    formatted = {}
+    for column in df_macloc.columns:
+        values = df_macloc[column]
+        if column in ('DebitBase', 'CreditBase'):
+            values = values.map(lambda x: f"{x:.2f}", na_action='ignore')
+        elif pd.api.types.is_float_dtype(values):
+            values = values.astype('Int64')
+        values = values.astype(object).where(values.notna(), "").astype(str)
+        # No quoting in the import file, so tabs and line breaks in the entry text are replaced by spaces
+        if column == 'EntryText':
+            values = values.str.replace(r'[\t\r\n]', ' ', regex=True)
+        formatted[column] = values
+    return pd.DataFrame(formatted, index=df_macloc.index)
+
+# Write the Maconomy "Import General Journal" file as tab separated text, streamed in chunks of rows.
+def write_maconomy_text(header_df: pd.DataFrame, df_macloc: pd.DataFrame, output_filename: str, chunksize: int = 10000, encoding: str = 'utf-8') -> None:
+    with open(output_filename, 'w', encoding=encoding, newline='\r\n') as f:
+        # The journal header rows, an empty line and the column names
+        for row in format_maconomy_columns(header_df).itertuples(index=False):
+            f.write('\t'.join(row) + '\n')
+        f.write('\n')
+        f.write('\t'.join(df_macloc.columns) + '\n')
+        f.flush()
+
+        for start in range(0, len(df_macloc), chunksize):
+            chunk = format_maconomy_columns(df_macloc.iloc[start:start + chunksize])
+            lines = chunk.iloc[:, 0].str.cat(chunk.iloc[:, 1:], sep='\t')
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+
+# Write the Maconomy import file as Excel in a single pass with a write-only workbook (same layout as the text file).
+def write_maconomy_excel(header_df: pd.DataFrame, df_macloc: pd.DataFrame, output_filename: str) -> None:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+
+    for row in header_df.itertuples(index=False):
+        ws.append(list(row))
+    ws.append([])
+    ws.append(list(df_macloc.columns))
+
+    # Debit and Credit cells are formatted as numbers with two digits
+    amount_columns = [df_macloc.columns.get_loc(column) for column in ('DebitBase', 'CreditBase')]
+    values = df_macloc.astype(object).where(df_macloc.notna(), None)
+    for row in values.itertuples(index=False):
+        row = list(row)
+        for i in amount_columns:
+            if row[i] is not None:
+                row[i] = WriteOnlyCell(ws, value=row[i])
+                row[i].number_format = '0.00'
+        ws.append(row)
+
+    wb.save(output_filename)
@@ -0,0 +1,67 @@
+#
+# Local cache of the mapping data (account tasks, Towards2040 and VAT jobs, see mapping_tables.py) and the MSAL token cache.
+# Re-runs within the TTL read the mapping from a Parquet file instead of logging in and calling the Maconomy API.
+# If the API can't be reached, the cached mapping (even if expired) or the mapping Excel file is used instead.
+import pandas as pd
+import os
+import time
+from get_mapping import get_mapping_data
+from mapping_tables import MappingTables, mapping_from_frame, mapping_records, mapping_from_records
+
+# Default location of the cache files (users home directory)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".vimpact")
+MAPPING_CACHE_FILE = os.path.join(CACHE_DIR, "mapping.parquet")
+TOKEN_CACHE_FILE = os.path.join(CACHE_DIR, "msal_token_cache.json")
+
+def read_mapping_cache(cache_file: str = MAPPING_CACHE_FILE, ttl_hours: float = None) -> MappingTables:
+    # Returns None if there is no cache or if it is older than the TTL
+    if not os.path.exists(cache_file):
+        return None
+    if ttl_hours is not None and time.time() - os.path.getmtime(cache_file) > ttl_hours * 3600:
+        return None
+    records = pd.read_parquet(cache_file)
+    # Cache files of earlier versions hold the 4 column mapping frame
+    return mapping_from_records(records) if 'Table' in records.columns else mapping_from_frame(records)
+
+def write_mapping_cache(mapping: MappingTables, cache_file: str = MAPPING_CACHE_FILE) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+    # Write to a temporary file first, so a broken run never leaves a half written cache
+    tmp_file = cache_file + ".tmp"
+    mapping_records(mapping).to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, cache_file)
+
+def get_mapping(client_id: str, tenant_id: str, scopes: list[str], api_gateway: str,
+                cache_file: str = MAPPING_CACHE_FILE, token_cache_file: str = TOKEN_CACHE_FILE,
+                ttl_hours: float = 24, refresh: bool = False, mp_filename: str = "mapping.xlsx") -> MappingTables:
+
+    # Use the cached mapping if it is fresh enough, unless a refresh is forced
+    if not refresh:
+        mapping = read_mapping_cache(cache_file, ttl_hours)
+        if mapping is not None:
+            print(f"\033[92m1) The mapping data was read from the cache {cache_file}.\033[0m")
+            return mapping
+
+    try:
+        # Imported here, so msal and requests are only loaded when the API is called
+        from azure_auth import get_mapping_api
+        mapping = get_mapping_api(client_id, tenant_id, scopes, api_gateway, token_cache_file=token_cache_file)
+    except Exception as e:
+        print(f"\033[91mError fetching the mapping data from the Maconomy API: {e}\033[0m")
+    else:
+        print(f"\033[92m1) The mapping data was fetched from the Maconomy API.\033[0m")
+        # The fetched mapping is used even if it can't be cached (no pyarrow, unwritable home directory)
+        try:
+            write_mapping_cache(mapping, cache_file)
+        except Exception as e:
+            print(f"\033[93mWarning: the mapping data could not be cached in {cache_file} ({e}).\033[0m")
+        return mapping
+
+    # Offline fallback: the last cached mapping (regardless of age) or the mapping Excel file
+    mapping = read_mapping_cache(cache_file)
+    if mapping is not None:
+        print(f"\033[93mOffline: using the cached mapping {cache_file}.\033[0m")
+        return mapping
+
+    print(f"\033[93mUsing the mapping Excel file {mp_filename}.\033[0m")
+    mapping_df = get_mapping_data(mp_filename)
+    return mapping_from_frame(mapping_df) if mapping_df is not None else None
@@ -0,0 +1,80 @@
+#
+# The mapping data compiled once into lookup tables that are shared by all the stages (preprocessing, company rules, validation):
+#   task_table    - array indexed by account/activity number with the code of its task (-1 if the account has no task),
+#                   for the account numbers up to MAX_ACCOUNT. Larger account numbers are looked up in accounts (binary search).
+#   tasks         - the task numbers (as strings) of the codes, used as the categories of Oppgave
+#   towards       - the Towards2040 job numbers
+#   vat_projects  - the jobs with VAT handling
+# The tasks of a whole column of accounts are found with one array lookup, and the job sets are used with Series.isin (hashed).
+# The tables are built from the three Maconomy API results, or from the 4 column mapping frame (mapping.xlsx).
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+from ledger_schema import mapping_numbers
+
+# Largest account number of the array table (the accounts/activities have 4 digits)
+MAX_ACCOUNT = 9_999
+
+@dataclass(frozen=True, eq=False)
+class MappingTables:
+    accounts: np.ndarray        # int64, the accounts with a task (sorted)
+    task_codes: np.ndarray      # int32, the task code of each account in accounts
+    tasks: pd.Index             # str, the task numbers of the codes
+    task_table: np.ndarray      # int32, the task code by account number (up to MAX_ACCOUNT)
+    towards: np.ndarray         # int64
+    vat_projects: np.ndarray    # int64
+
+# Build the tables from the account and task columns and the job number columns (numbers or strings, empty cells are left out)
+def compile_mapping(accounts: pd.Series, tasks: pd.Series, towards: pd.Series, vat_projects: pd.Series) -> MappingTables:
+    pairs = pd.DataFrame({'Account': pd.Series(accounts).to_numpy(), 'Task': pd.Series(tasks).to_numpy()}).dropna()
+    pairs['Account'] = pd.to_numeric(pairs['Account'], errors='coerce')
+    pairs = pairs[pairs['Account'].notna() & (pairs['Account'] >= 0)]
+    # The first task wins if an account is listed more than once
+    pairs = pairs.drop_duplicates(subset='Account').sort_values('Account')
+
+    # Task numbers read as decimals (empty cells in the Excel column) are written without the decimals
+    task_names = pairs['Task'].astype('Int64').astype(str) if pd.api.types.is_float_dtype(pairs['Task']) else pairs['Task'].astype(str)
+    task_categories = pd.Categorical(task_names)
+
+    account_numbers = pairs['Account'].to_numpy().astype(np.int64)
+    task_codes = task_categories.codes.astype(np.int32)
+    # The array table only covers the account numbers up to MAX_ACCOUNT, so an odd large account number doesn't blow it up
+    dense = account_numbers <= MAX_ACCOUNT
+    task_table = np.full(account_numbers[dense].max() + 1 if dense.any() else 0, -1, dtype=np.int32)
+    task_table[account_numbers[dense]] = task_codes[dense]
+
+    return MappingTables(account_numbers, task_codes, pd.Index(task_categories.categories.astype(str)), task_table,
+                         np.unique(mapping_numbers(pd.Series(towards))), np.unique(mapping_numbers(pd.Series(vat_projects))))
+
+# The mapping frame of get_mapping_data (Account, Task, Towards, Project_VAT by position, columns padded with empty cells)
+def mapping_from_frame(mapping_df: pd.DataFrame) -> MappingTables:
+    return compile_mapping(mapping_df.iloc[:, 0], mapping_df.iloc[:, 1], mapping_df.iloc[:, 2], mapping_df.iloc[:, 3])
+
+# The task of every account as a categorical (missing when the account has no task)
+def account_tasks(mapping: MappingTables, konto: np.ndarray) -> pd.Categorical:
+    konto = np.asarray(konto, dtype=np.int64)
+    codes = np.full(len(konto), -1, dtype=np.int32)
+    inside = (konto >= 0) & (konto < len(mapping.task_table))
+    codes[inside] = mapping.task_table[konto[inside]]
+    # Account numbers above MAX_ACCOUNT are found with a binary search in the sorted accounts
+    if len(mapping.accounts) and mapping.accounts[-1] > MAX_ACCOUNT:
+        large = np.flatnonzero(konto > MAX_ACCOUNT)
+        positions = np.searchsorted(mapping.accounts, konto[large])
+        found = positions < len(mapping.accounts)
+        found[found] = mapping.accounts[positions[found]] == konto[large[found]]
+        codes[large[found]] = mapping.task_codes[positions[found]]
+    return pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(mapping.tasks))
+
+# The tables as one long table (Table, Number, Task) for the mapping cache, and back
+def mapping_records(mapping: MappingTables) -> pd.DataFrame:
+    return pd.concat([
+        pd.DataFrame({'Table': 'task', 'Number': mapping.accounts, 'Task': mapping.tasks[mapping.task_codes].to_numpy()}),
+        pd.DataFrame({'Table': 'towards', 'Number': mapping.towards, 'Task': None}),
+        pd.DataFrame({'Table': 'vat', 'Number': mapping.vat_projects, 'Task': None}),
+    ], ignore_index=True)
+
+def mapping_from_records(records: pd.DataFrame) -> MappingTables:
+    tables = {table: rows for table, rows in records.groupby('Table')}
+    empty = records.iloc[0:0]
+    task_rows, towards_rows, vat_rows = (tables.get(table, empty) for table in ('task', 'towards', 'vat'))
+    return compile_mapping(task_rows['Number'], task_rows['Task'], towards_rows['Number'], vat_rows['Number'])
@@ -1,33 +1,40 @@
 import pandas as pd
 import os
-import warnings
+from hlt_reader import read_hlt
+from ledger_schema import apply_ledger_schema
+from profiling import stage
+from report_reader import read_report, REPORT_CACHE_DIR
+from mapping_tables import MappingTables, account_tasks
 
 # Read the H&L file into a DataFrame. Use fixed-width format to read the file.
-def process_input_files(hl_filename :str, dr_filename: str, mp_dataframe: pd.DataFrame) -> pd.DataFrame:
-
-    # Mapping - Task lookup from Account.
-    mp = mp_dataframe.iloc[:, [0, 1]]
+def process_input_files(hl_filename :str, dr_filename: str, mapping: MappingTables, report_cache_dir: str = REPORT_CACHE_DIR) -> pd.DataFrame:
 
     try:
-        # Define the column specifications for the fixed-width Visma Payroll accounting file
-        hlcolspecs = [(0, 12), (12, 14), (14, 26), (26, 38), (38, 50), (50, 62), (62, 74), (74, 86), (86, 98), (98, 118), (118, 121), (121, 129), (129, 139), (139, 149), (149, 160), (149,150) ] 
-        hlcolumn_names = ['Konto', 'MVA', 'Avdeling', 'Prosjekt', 'Medarbeider', 'R4', 'R5', 'R6', 'R7', 'ID', 'Filler', 'Dato', 'Ant', 'Sats', 'Beløp', 'Sign']  
-        # Read the fixed-width file into a DataFrame
-        hldf = pd.read_fwf(hl_filename, colspecs=hlcolspecs, names=hlcolumn_names)
-        
+        # Read the needed fields of the fixed-width Visma Payroll accounting file into a DataFrame (see hlt_reader.py for the colspecs)
+        # Dato is read as a date and Beløp as øre
+        with stage("HLT read") as s:
+            hldf = read_hlt(hl_filename)
+            s['rows_out'] = len(hldf)
+
     except FileExistsError as e:
         print(f"\033[91mError: The file {e} is in use by another application or file not found.\033[0m")
         return None
+    except ValueError as e:
+        # Malformed records (non-numeric fields, lines of another length)
+        print(f"\033[91mError: The HL file {hl_filename} is not a valid H & L accounting file: {e}\033[0m")
+        return None
     except Exception as e:
         print(f"\033[91mError reading the file. The file might be in use: {e}\033[0m")
         return None
-    else:    
+    else:
         print(f"\033[92m2) The HL Payroll accounting file read successfully.\033[0m")
 
     # Read the supporting Visma Payroll report file (Excel) - Transaksjoner, detaljert.xlsx into a DataFrame.
+    # Only the travel ID and text are read (see report_reader.py), and the result is cached per report file.
     try:
-        warnings.filterwarnings("ignore", category=UserWarning, message="Workbook contains no default style, apply openpyxl's default")    
-        drdf = pd.read_excel(dr_filename, skiprows=1, engine='openpyxl')
+        with stage("report read") as s:
+            drdf = read_report(dr_filename, report_cache_dir)
+            s['rows_out'] = len(drdf)
     except FileExistsError as e:
         print(f"\033[91mError: The file {e} is in use by another application or file not found.\033[0m")
         return None
@@ -41,75 +48,31 @@ def process_input_files(hl_filename :str, dr_filename: str, mp_dataframe: pd.Dat
     # Data processing and transformation
     #########################################################################################################
     try:
-        # Removing the columns that are not needed in the Payroll accounting dataframe
-        hldf.drop(columns=['R4', 'R5', 'R6', 'R7', 'Filler', 'Ant', 'Sats'], inplace=True)
-
         # Insert column 'Oppgave' between 'Prosjekt' and 'Medarbeider'
         hldf.insert(hldf.columns.get_loc('Medarbeider'), 'Oppgave', None)
 
-        # convert Prosjekt to string
-        hldf['Prosjekt'] = hldf['Prosjekt'].astype(str)
-        hldf['Oppgave'] = hldf['Oppgave'].astype(str)
-        hldf['Avdeling'] = hldf['Avdeling'].astype(str)
-        hldf['Medarbeider'] = hldf['Medarbeider'].astype(str)
-        hldf['Konto'] = hldf['Konto'].astype(str)
-        hldf['ID'] = hldf['ID'].astype(str)
-        
-        hldf.loc[hldf['Prosjekt'] == "0", 'Prosjekt'] = ""
-        hldf.loc[hldf['Avdeling'] == "0", 'Avdeling'] = ""
-        hldf.loc[hldf['Medarbeider'] == "0", 'Medarbeider'] = ""
-        hldf.loc[hldf['ID'] == "0", 'ID'] = ""
-        hldf.loc[hldf['Oppgave'] == "0", 'Oppgave'] = ""
-
-  
-        # Converting to proper datatypes - hldf DataFrame
-        hldf['Dato'] = pd.to_datetime(hldf['Dato'], format='%d%m%Y', errors='coerce')
-        hldf['Beløp'] = hldf['Beløp'].astype(float) / 100
-        # hldf['Konto'] = pd.to_numeric(hldf['Konto'], errors='coerce')
-        # hldf['ID'] = pd.to_numeric(hldf['ID'], errors='coerce')
-                
-        # Populate 'Sign' with "+" if Sign is not "-"
-        hldf.loc[(hldf['Sign'] != "-"), 'Sign'] = "+"
-
-        
-
-        # Populate 'Oppgave' with Task from mp. Mapping should be done on Konto=Account.
-        mp.columns = ['Account', 'Task']
-
-       
-        # IF statments to assign a task number if project is specified in the accounting file.     
-        # If Prosjekt is not empty, then map the Task from mp DataFrame to Oppgave column in hldf DataFrame    
-        hldf.loc[hldf['Prosjekt'] != "", 'Oppgave'] = hldf['Konto'].map(mp.set_index('Account')['Task'])
-        hldf.loc[hldf['Prosjekt'] == "", 'Oppgave'] = ""
-        
-        # If Avdeling is 0, then set Avdeling to NaN
-        hldf.loc[hldf['Avdeling'] == 0, 'Avdeling'] = ""
-
-        # Don't need the Sign column anymore
-        hldf.drop(columns=['Sign'], inplace=True)
-
-        #drdf['Reiseregning ID'] = drdf['Reiseregning ID'].astype(str).str[:-2] (just wonder about this str-fuction. That must have been copilot....)
-        drdf['Reiseregning ID'] = drdf['Reiseregning ID'].astype(str)
-       
-        drdf.loc[drdf['Lønnsart'].astype(str).str.startswith("13120"), 'Tekst'] = drdf['Ansattnummer']
-        drdf.loc[drdf['Lønnsart'].astype(str).str.startswith("13120"), 'Reiseregning ID'] = drdf['Ansattnummer']
+        # Zero means not specified in the accounting file. These are stored as missing values (see ledger_schema.py).
+        for column in ['Avdeling', 'Prosjekt', 'Medarbeider', 'ID']:
+            hldf[column] = hldf[column].astype('Int64').mask(hldf[column] == 0)
 
-          # Remove the columns that are not needed in the Payroll report DataFrame                
-        drdf.drop(columns=['Lønnsperiode', 'Ansattnummer', 'Lønnsart', 'Beløp', 'MVA-kode'], inplace=True)
+        # Populate 'Oppgave' with Task from the mapping. Mapping should be done on Konto=Account (array lookup, see mapping_tables.py).
+        # IF statments to assign a task number if project is specified in the accounting file.
+        # If Prosjekt is not empty, then map the Task from the mapping to Oppgave column in hldf DataFrame
+        hldf['Oppgave'] = pd.Series(account_tasks(mapping, hldf['Konto'].to_numpy()), index=hldf.index).where(hldf['Prosjekt'].notna())
 
-        # Rename the columns in drdf DataFrame
-        drdf = drdf.pivot_table(index=['Tekst', 'Reiseregning ID'], aggfunc='first').reset_index()
+        with stage("text join", rows_in=len(hldf)) as s:
+            # Merging: Add the column Text to hldf DataFrame and use a vlookup-like function to fetch drdf and join on ID=Reiseregning ID
+            # The Reiseregning ID -> Tekst index (one text per ID, the 13120 lines already rewritten by read_report) is joined on all rows in one go.
+            travel_text = drdf.set_index('Reiseregning ID')['Tekst']
+            salary_text = 'Lønn (' + hldf['Dato'].dt.strftime('%Y-%m-%d') + ')'
+            text = hldf['ID'].map(travel_text).astype(object)
+            text = text.where(text.isna(), text.astype(str)).fillna(salary_text)
 
-            
-        # Merging: Add the column Text to hldf DataFrame and use a vlookup-like function to fetch drdf and join on ID=Reiseregning ID     
-        hldf['Text'] = hldf.apply(lambda row: f"{drdf.set_index('Reiseregning ID')['Tekst'].get(row['ID'], 
-        f'Lønn ({row['Dato'].strftime('%Y-%m-%d')})')}" 
-        if 'Lønn' in drdf.set_index('Reiseregning ID')['Tekst'].get(row['ID'], 
-        f'Lønn ({row['Dato'].strftime('%Y-%m-%d')})') 
-        else f"{drdf.set_index('Reiseregning ID')['Tekst'].get(row['ID'], 
-        f'Lønn ({row['Dato'].strftime('%Y-%m-%d')})')} ({row['ID']})", axis=1)
+            # Travel texts get the travel ID appended, salary texts (containing "Lønn") are left as they are.
+            hldf['Text'] = text.where(text.str.contains('Lønn', regex=False, na=False), text + ' (' + hldf['ID'].astype(str) + ')')
+            s['rows_out'] = len(hldf)
 
-       
+        hldf = apply_ledger_schema(hldf)
 
     except Exception as e:
         print(f"\033[91mError processing the data: {e}\033[0m")
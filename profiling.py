@@ -0,0 +1,81 @@
+#
+# Per-stage instrumentation of the conversion: wall time, rows in/out and peak memory of every stage.
+# The peak memory of a stage is its peak traced memory above the memory already in use when the stage started.
+# Profiling is off by default and the stages cost next to nothing then. Enable it with enable_profiling() (vimpact.py --profile),
+# print the table with print_profile() and append the run to a JSONL report with write_profile().
+#
+# Usage:
+#     with stage("HLT read") as s:
+#         hldf = read_hlt(hl_filename)
+#         s['rows_out'] = len(hldf)
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+_enabled = False
+_records = []
+_lock = threading.Lock()
+# Peak memory of the enclosing stages (main thread only), so nested stages don't lose the peak of their parents
+_peak_stack = []
+
+def enable_profiling(trace_memory: bool = True) -> None:
+    global _enabled
+    _enabled = True
+    _records.clear()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable_profiling() -> None:
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def profile_records() -> list[dict]:
+    with _lock:
+        return list(_records)
+
+@contextmanager
+def stage(name: str, rows_in: int = None):
+    record = {'stage': name, 'seconds': None, 'rows_in': rows_in, 'rows_out': None, 'peak_mb': None}
+    if not _enabled:
+        yield record
+        return
+
+    # Memory is measured for the stages of the main thread. Stages in worker threads (HTTP calls) get time and rows only.
+    trace_memory = tracemalloc.is_tracing() and threading.current_thread() is threading.main_thread()
+    if trace_memory:
+        if _peak_stack:
+            _peak_stack[-1] = max(_peak_stack[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        _peak_stack.append(start_memory)
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 4)
+        if trace_memory:
+            peak = max(_peak_stack.pop(), tracemalloc.get_traced_memory()[1])
+            if _peak_stack:
+                _peak_stack[-1] = max(_peak_stack[-1], peak)
+            record['peak_mb'] = round((peak - start_memory) / 2**20, 2)
+        with _lock:
+            _records.append(record)
+
+def print_profile() -> None:
+    records = profile_records()
+    print(f"{'Stage':<32}{'Seconds':>10}{'Rows in':>12}{'Rows out':>12}{'Peak MB':>10}")
+    for record in records:
+        values = [record[key] if record[key] is not None else '' for key in ('seconds', 'rows_in', 'rows_out', 'peak_mb')]
+        print(f"{record['stage']:<32}{values[0]:>10}{values[1]:>12}{values[2]:>12}{values[3]:>10}")
+
+# Append the stages of this run as one JSON line (with run information such as the input file) to the report file
+def write_profile(report_filename: str, **run_info) -> None:
+    run = {'run_finished': datetime.now().isoformat(timespec='seconds'), **run_info, 'stages': profile_records()}
+    with open(report_filename, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run, ensure_ascii=False, default=str) + '\n')
@@ -0,0 +1,99 @@
+#
+# Reader of the Visma Payroll report "Transaksjoner, detaljert" (Excel).
+# Only the travel ID -> text relation is needed from the report, so only the columns Lønnsart, Ansattnummer, Tekst and
+# Reiseregning ID are read: with the calamine engine when python-calamine is installed, otherwise with openpyxl in read-only
+# mode (values only, rows streamed and deduplicated while reading). The result is cached as Parquet in ~/.vimpact/reports,
+# keyed by a hash of the file content, so a re-run on the same report doesn't read the Excel file again.
+import pandas as pd
+import hashlib
+import importlib.util
+import os
+import zipfile
+from functools import lru_cache
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+
+REPORT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".vimpact", "reports")
+# Change when the content of the cached result changes, so old cache files are not used
+REPORT_CACHE_VERSION = "2"
+
+# The column names are in the second row of the report (the first row is the title)
+HEADER_ROW = 2
+REPORT_COLUMNS = ['Lønnsart', 'Ansattnummer', 'Tekst', 'Reiseregning ID']
+
+# Read the distinct rows (values of REPORT_COLUMNS) of the first worksheet with openpyxl in read-only mode
+def _read_report_rows(dr_filename: str) -> pd.DataFrame:
+    workbook = openpyxl.load_workbook(dr_filename, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(min_row=HEADER_ROW, values_only=True)
+        header = list(next(rows, ()))
+        missing = [column for column in REPORT_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"The report has no column {', '.join(missing)} in row {HEADER_ROW}")
+        positions = [header.index(column) for column in REPORT_COLUMNS]
+        # Identical rows are removed on the fly, so only the distinct rows are kept in memory
+        distinct = dict.fromkeys(tuple(row[i] if i < len(row) else None for i in positions) for row in rows)
+    finally:
+        workbook.close()
+    return pd.DataFrame(list(distinct), columns=REPORT_COLUMNS, dtype=object)
+
+def _read_report_columns(dr_filename: str) -> pd.DataFrame:
+    if importlib.util.find_spec("python_calamine") is not None:
+        return pd.read_excel(dr_filename, engine="calamine", skiprows=HEADER_ROW - 1, usecols=REPORT_COLUMNS, dtype=object)
+    try:
+        return _read_report_rows(dr_filename)
+    except (InvalidFileException, zipfile.BadZipFile):
+        # Not an xlsx file (e.g. an .xls file): read the needed columns with pandas
+        return pd.read_excel(dr_filename, skiprows=HEADER_ROW - 1, usecols=REPORT_COLUMNS, dtype=object)
+
+def _parse_report(dr_filename: str) -> pd.DataFrame:
+    drdf = _read_report_columns(dr_filename)
+
+    # Expense lines with wage type 13120 use the employee number as text and travel ID
+    wage_13120 = drdf['Lønnsart'].astype(str).str.startswith("13120")
+    drdf['Tekst'] = drdf['Tekst'].mask(wage_13120, drdf['Ansattnummer'])
+    drdf['Reiseregning ID'] = pd.to_numeric(drdf['Reiseregning ID'].mask(wage_13120, drdf['Ansattnummer']), errors='coerce')
+
+    # One text per travel ID. With several texts for the same ID the first in sorted order is used.
+    drdf = drdf.dropna(subset=['Tekst', 'Reiseregning ID'])
+    drdf = drdf.astype({'Reiseregning ID': 'int64', 'Tekst': str}).sort_values(['Reiseregning ID', 'Tekst'])
+    return drdf.drop_duplicates(subset='Reiseregning ID')[['Reiseregning ID', 'Tekst']].reset_index(drop=True)
+
+def _report_hash(dr_filename: str) -> str:
+    digest = hashlib.sha1(REPORT_CACHE_VERSION.encode())
+    with open(dr_filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# The travel texts of the report: one row per travel ID (int64) with the text (str).
+# With cache_dir=None the report is always parsed and nothing is cached on disk.
+# The last reports read are also kept in memory (by file name, modification time and size), so a second read in the
+# same process (e.g. the validation) is free. The returned DataFrame is shared and must not be modified.
+def read_report(dr_filename: str, cache_dir: str = REPORT_CACHE_DIR) -> pd.DataFrame:
+    stat = os.stat(dr_filename)
+    return _read_report(os.path.abspath(dr_filename), stat.st_mtime_ns, stat.st_size, cache_dir)
+
+@lru_cache(maxsize=8)
+def _read_report(dr_filename: str, mtime_ns: int, size: int, cache_dir: str) -> pd.DataFrame:
+    if cache_dir is None:
+        return _parse_report(dr_filename)
+
+    # The cache is only a speed-up: if it can't be read or written (no pyarrow, unwritable home directory) the report is parsed
+    cache_file = os.path.join(cache_dir, _report_hash(dr_filename) + ".parquet")
+    try:
+        if os.path.exists(cache_file):
+            return pd.read_parquet(cache_file)
+    except Exception as e:
+        print(f"\033[93mWarning: the cached payroll report could not be read ({e}), the report is read again.\033[0m")
+
+    travel_text = _parse_report(dr_filename)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file first, so a broken run never leaves a half written cache
+        tmp_file = cache_file + ".tmp"
+        travel_text.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        print(f"\033[93mWarning: the payroll report could not be cached in {cache_dir} ({e}).\033[0m")
+    return travel_text
@@ -0,0 +1,76 @@
+#
+# Synthetic Visma Payroll test data: a fixed-width HL accounting file (HLTrans_<orgno>_<YYYYMM>.HLT) and the matching
+# "Transaksjoner, detaljert" Excel report, at any size. The data is random but reproducible (seeded), balanced
+# (every posting has a counter posting on the same date and department) and uses the accounts and projects of mapping.xlsx.
+#
+# Example: python synthetic_data.py --lines 100000 --output-dir bench_data
+import argparse
+import os
+import random
+from openpyxl import Workbook
+
+# Expense accounts (covering every account rule in company_specs.py) and the counter account of the postings
+ACCOUNTS = [4330, 4530, 5000, 5010, 5100, 5320, 5321, 5325, 5330, 5510, 5555, 5560, 5900, 5950, 5960, 6540, 6560, 6800, 6920, 7100, 7140, 7150, 7320, 7500]
+COUNTER_ACCOUNT = 2931
+# No project, internal projects, VAT projects, Towards2040 projects and other invoicable projects
+PROJECTS = [0, 0, 0, 10010, 20000, 30924, 30949, 31242, 31441, 31443, 31456, 35000, 35001, 36000]
+DEPARTMENTS = [10, 20, 30]
+VAT_CODES = [0, 0, 0, 1, 11]
+TRAVEL_TEXTS = ['Reise Bergen', 'Konferanse Paris', 'Lønn tillegg', 'Feltarbeid Kenya', 'Workshop Brussel', 'COP Baku']
+WAGE_TYPES = [13100, 13120, 13200, 13300]
+
+# One HL record: Konto, MVA, Avdeling, Prosjekt, Medarbeider, R4-R7, ID, Filler, Dato, Ant, Sats, Beløp (sign first)
+def hlt_record(konto: int, mva: int, avdeling: int, prosjekt: int, medarbeider: int, travel_id: int, day: int, month: int, year: int, ore: int) -> str:
+    sign = '-' if ore < 0 else '+'
+    return (f"{konto:012d}{mva:02d}{avdeling:012d}{prosjekt:012d}{medarbeider:012d}" + "0" * 48 + f"{travel_id:020d}" + "   "
+            + f"{day:02d}{month:02d}{year:04d}" + "0" * 20 + f"{sign}{abs(ore):010d}")
+
+def generate(output_dir: str, lines: int, orgno: str = "971274190", period: str = "202507", seed: int = 1,
+             employees: int = 50) -> tuple[str, str]:
+    rnd = random.Random(seed)
+    year, month = int(period[:4]), int(period[4:])
+    employee_numbers = [1000 + i for i in range(employees)]
+    # About one travel report per 25 HL lines, each with 1-3 report lines
+    travel_ids = [100000 + i for i in range(max(1, lines // 25))]
+
+    os.makedirs(output_dir, exist_ok=True)
+    hl_filename = os.path.join(output_dir, f"HLTrans_{orgno}_{period}.HLT")
+    dr_filename = os.path.join(output_dir, "Transaksjoner, detaljert.xlsx")
+
+    # The HL file, two records (posting and counter posting) at a time
+    with open(hl_filename, 'w', encoding='latin-1', newline='\r\n') as f:
+        for i in range(0, lines, 2):
+            avdeling = rnd.choice(DEPARTMENTS)
+            medarbeider = rnd.choice(employee_numbers)
+            travel_id = rnd.choice(travel_ids) if rnd.random() < 0.5 else 0
+            day = rnd.randint(1, 28)
+            ore = rnd.randint(-200000, 500000) or 100
+            f.write(hlt_record(rnd.choice(ACCOUNTS), rnd.choice(VAT_CODES), avdeling, rnd.choice(PROJECTS), medarbeider, travel_id, day, month, year, ore) + '\n')
+            if i + 1 < lines:
+                f.write(hlt_record(COUNTER_ACCOUNT, 0, avdeling, 0, medarbeider, travel_id, day, month, year, -ore) + '\n')
+
+    # The payroll report: a title row, the column names and the expense lines of the travel reports
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['Transaksjoner, detaljert'])
+    ws.append(['Lønnsperiode', 'Ansattnummer', 'Lønnsart', 'Beløp', 'Tekst', 'Reiseregning ID', 'MVA-kode'])
+    for travel_id in travel_ids:
+        medarbeider = rnd.choice(employee_numbers)
+        text = rnd.choice(TRAVEL_TEXTS)
+        for _ in range(rnd.randint(1, 3)):
+            ws.append([period, medarbeider, rnd.choice(WAGE_TYPES), rnd.randint(100, 99999) / 100, text, travel_id, rnd.choice(VAT_CODES)])
+    wb.save(dr_filename)
+
+    return hl_filename, dr_filename
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic Visma HL file and payroll report.")
+    parser.add_argument("--lines", type=int, default=1000, help="Number of HL lines")
+    parser.add_argument("--output-dir", default="bench_data")
+    parser.add_argument("--orgno", default="971274190")
+    parser.add_argument("--period", default="202507", help="YYYYMM")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    hl_filename, dr_filename = generate(args.output_dir, args.lines, args.orgno, args.period, args.seed)
+    print(f"\033[92mWritten {hl_filename} and {dr_filename}.\033[0m")
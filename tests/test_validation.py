@@ -0,0 +1,41 @@
+#
+# Checks of validation.py on a small hand-made ledger (python -m pytest tests)
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from company_specs import company_specific_transactions
+from ledger_schema import apply_ledger_schema
+from mapping_tables import compile_mapping
+from validation import validate_ledger, has_errors
+
+# Job 31242 has VAT handling, job 35000 has not
+MAPPING = compile_mapping(pd.Series([6540, 2931]), pd.Series(['30', '30']), pd.Series([], dtype=object), pd.Series([31242]))
+
+def ledger(mva: int, prosjekt: int) -> pd.DataFrame:
+    return apply_ledger_schema(pd.DataFrame({
+        'Konto': [6540, 2931],
+        'MVA': [mva, 0],
+        'Avdeling': [10, 10],
+        'Prosjekt': pd.array([prosjekt, pd.NA], dtype='Int64'),
+        'Oppgave': ['30', None],
+        'Medarbeider': [1001, 1001],
+        'ID': pd.array([pd.NA, pd.NA], dtype='Int64'),
+        'Dato': pd.to_datetime(['2025-07-01', '2025-07-01']),
+        'Beløp': [12500, -12500],
+        'Text': ['Lønn (2025-07-01)', 'Lønn (2025-07-01)'],
+    }))
+
+def test_vat_on_job_without_vat_handling_is_reported():
+    accounting_df = ledger(mva=11, prosjekt=35000)
+    issues = validate_ledger(accounting_df, company_specific_transactions(accounting_df, MAPPING), MAPPING)
+    vat = issues[issues['check'] == 'vat']
+    assert vat['key'].tolist() == ['job 35000']
+    assert vat['severity'].tolist() == ['warning']
+    assert not has_errors(issues)
+
+def test_vat_on_vat_project_is_not_reported():
+    accounting_df = ledger(mva=11, prosjekt=31242)
+    issues = validate_ledger(accounting_df, company_specific_transactions(accounting_df, MAPPING), MAPPING)
+    assert (issues['check'] != 'vat').all()
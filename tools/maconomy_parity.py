@@ -0,0 +1,133 @@
+#
+# Parity check of the vectorised transform_to_maconomy (maconomy.py) against the original row-wise implementation (completes user-003).
+# The original preprocessing (read_fwf, string-typed ledger) and the original row-wise transform are kept below, unchanged
+# apart from the prints and error handling and Dato read as text. Both pipelines run on the same synthetic HL file and payroll report, with the same
+# mapping in the API format (strings): original preprocessing + row-wise transform, and process_input_files + transform_to_maconomy.
+# The journals are formatted as in the import file (format_maconomy_columns) and must be identical, cell by cell.
+#
+# Example: python tools/maconomy_parity.py --lines 5000
+import argparse
+import os
+import sys
+import tempfile
+import warnings
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from get_mapping import get_mapping_data
+from mapping_tables import mapping_from_frame
+from preprosessing import process_input_files
+from maconomy import transform_to_maconomy, format_maconomy_columns
+from synthetic_data import generate
+
+# The original preprocessing (HL file read with read_fwf, all the dimensions as strings, "" for missing values, Beløp in kroner)
+def process_input_files_legacy(hl_filename: str, dr_filename: str, mp_dataframe: pd.DataFrame) -> pd.DataFrame:
+    mp = mp_dataframe.iloc[:, [0, 1]].copy()
+
+    hlcolspecs = [(0, 12), (12, 14), (14, 26), (26, 38), (38, 50), (50, 62), (62, 74), (74, 86), (86, 98), (98, 118), (118, 121), (121, 129), (129, 139), (139, 149), (149, 160), (149,150) ]
+    hlcolumn_names = ['Konto', 'MVA', 'Avdeling', 'Prosjekt', 'Medarbeider', 'R4', 'R5', 'R6', 'R7', 'ID', 'Filler', 'Dato', 'Ant', 'Sats', 'Beløp', 'Sign']
+    # Dato as text: read as a number the leading zero of the days 1-9 was lost (01072025 parsed as 10/07/2025), which hlt_reader.py reads correctly
+    hldf = pd.read_fwf(hl_filename, colspecs=hlcolspecs, names=hlcolumn_names, dtype={'Dato': str})
+    warnings.filterwarnings("ignore", category=UserWarning, message="Workbook contains no default style, apply openpyxl's default")
+    drdf = pd.read_excel(dr_filename, skiprows=1, engine='openpyxl')
+
+    hldf.drop(columns=['R4', 'R5', 'R6', 'R7', 'Filler', 'Ant', 'Sats'], inplace=True)
+    hldf.insert(hldf.columns.get_loc('Medarbeider'), 'Oppgave', None)
+
+    hldf['Prosjekt'] = hldf['Prosjekt'].astype(str)
+    hldf['Oppgave'] = hldf['Oppgave'].astype(str)
+    hldf['Avdeling'] = hldf['Avdeling'].astype(str)
+    hldf['Medarbeider'] = hldf['Medarbeider'].astype(str)
+    hldf['Konto'] = hldf['Konto'].astype(str)
+    hldf['ID'] = hldf['ID'].astype(str)
+
+    hldf.loc[hldf['Prosjekt'] == "0", 'Prosjekt'] = ""
+    hldf.loc[hldf['Avdeling'] == "0", 'Avdeling'] = ""
+    hldf.loc[hldf['Medarbeider'] == "0", 'Medarbeider'] = ""
+    hldf.loc[hldf['ID'] == "0", 'ID'] = ""
+    hldf.loc[hldf['Oppgave'] == "0", 'Oppgave'] = ""
+
+    hldf['Dato'] = pd.to_datetime(hldf['Dato'], format='%d%m%Y', errors='coerce')
+    hldf['Beløp'] = hldf['Beløp'].astype(float) / 100
+    hldf.loc[(hldf['Sign'] != "-"), 'Sign'] = "+"
+
+    mp.columns = ['Account', 'Task']
+    hldf.loc[hldf['Prosjekt'] != "", 'Oppgave'] = hldf['Konto'].map(mp.set_index('Account')['Task'])
+    hldf.loc[hldf['Prosjekt'] == "", 'Oppgave'] = ""
+    hldf.loc[hldf['Avdeling'] == 0, 'Avdeling'] = ""
+    hldf.drop(columns=['Sign'], inplace=True)
+
+    drdf['Reiseregning ID'] = drdf['Reiseregning ID'].astype(str)
+    drdf.loc[drdf['Lønnsart'].astype(str).str.startswith("13120"), 'Tekst'] = drdf['Ansattnummer']
+    drdf.loc[drdf['Lønnsart'].astype(str).str.startswith("13120"), 'Reiseregning ID'] = drdf['Ansattnummer']
+    drdf.drop(columns=['Lønnsperiode', 'Ansattnummer', 'Lønnsart', 'Beløp', 'MVA-kode'], inplace=True)
+    drdf = drdf.pivot_table(index=['Tekst', 'Reiseregning ID'], aggfunc='first').reset_index()
+
+    travel_text = drdf.drop_duplicates(subset='Reiseregning ID').set_index('Reiseregning ID')['Tekst']
+    salary_text = 'Lønn (' + hldf['Dato'].dt.strftime('%Y-%m-%d') + ')'
+    text = hldf['ID'].map(travel_text).astype(object)
+    text = text.where(text.isna(), text.astype(str)).fillna(salary_text)
+    hldf['Text'] = text.where(text.str.contains('Lønn', regex=False, na=False), text + ' (' + hldf['ID'] + ')')
+    return hldf
+
+# The original row-wise transform (unchanged)
+def transform_to_maconomy_rowwise(input_df_hldf: pd.DataFrame) -> pd.DataFrame:
+    df_macloc = pd.DataFrame(columns=['GeneralJournal:Format','TransactionNumber', 'EntryDate', 'EntryText', 'TypeOfEntry', 'AccountNumber', 'FinanceVATCode', 'DebitBase', 'CreditBase','EntityName','JobNumber','TaskName','ActivityNumber','EmployeeNumber'])
+    df_macloc['EntryDate'] = input_df_hldf['Dato'].dt.strftime('%d/%m/%Y')
+    df_macloc['EntryText'] = input_df_hldf.apply(lambda row: row['Text'] if isinstance(row['Text'], str) else None, axis=1)
+    df_macloc['TypeOfEntry'] = 'G'
+
+    df_macloc['AccountNumber'] = input_df_hldf.apply(lambda row: row['Konto'] if row['Prosjekt'] =="" else None, axis=1)
+    df_macloc['FinanceVATCode'] = input_df_hldf.apply(lambda row: row['MVA'] if row['MVA'] > 0 else None, axis=1)
+    df_macloc['DebitBase'] = input_df_hldf.apply(lambda row: row['Beløp'] if row['Beløp'] > 0 else None, axis=1)
+    df_macloc['CreditBase'] = input_df_hldf.apply(lambda row: abs(row['Beløp']) if row['Beløp'] < 0 else None, axis=1)
+    df_macloc['EntityName'] = input_df_hldf.apply(lambda row: row['Avdeling'] if isinstance(row['Avdeling'], str) else None, axis=1)
+    df_macloc['ActivityNumber'] = input_df_hldf.apply(lambda row: row['Konto'] if row['Prosjekt'] > "1" else None, axis=1)
+    df_macloc['JobNumber'] = input_df_hldf.apply(lambda row: row['Prosjekt'] if row['Prosjekt'] > "0" else None, axis=1)
+    df_macloc['EmployeeNumber'] = input_df_hldf.apply(lambda row: row['Medarbeider'] if row['Medarbeider'] != '0' else None, axis=1)
+    df_macloc['TaskName'] = input_df_hldf.apply(lambda row: row['Oppgave'] if row['Oppgave'] else None, axis=1)
+    df_macloc['GeneralJournal:Format'] = 'GENERALJOURNAL:CREATE'
+    df_macloc['TransactionNumber'] = '#KEEP'
+
+    return df_macloc
+
+# The mapping Excel file in the format of the Maconomy API (account and task numbers as strings)
+def api_mapping_frame(mp_filename: str) -> pd.DataFrame:
+    mapping_df = get_mapping_data(mp_filename)
+    tasks = mapping_df[['Account', 'Task']].dropna()
+    return pd.DataFrame({'Account': tasks['Account'].astype('int64').astype(str), 'Task': tasks['Task'].astype('int64').astype(str),
+                         'Towards': None, 'Project_VAT': None})
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the Maconomy transform with the original row-wise implementation.")
+    parser.add_argument("--lines", type=int, default=2000, help="Number of synthetic HL lines")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mapping-file", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mapping.xlsx"))
+    args = parser.parse_args()
+
+    mapping_df = api_mapping_frame(args.mapping_file)
+    with tempfile.TemporaryDirectory() as data_dir:
+        hl_filename, dr_filename = generate(data_dir, args.lines, seed=args.seed)
+        legacy_df = process_input_files_legacy(hl_filename, dr_filename, mapping_df)
+        accounting_df = process_input_files(hl_filename, dr_filename, mapping_from_frame(mapping_df), report_cache_dir=None)
+    if accounting_df is None:
+        return 1
+
+    expected = format_maconomy_columns(transform_to_maconomy_rowwise(legacy_df)).reset_index(drop=True)
+    actual = format_maconomy_columns(transform_to_maconomy(accounting_df)).reset_index(drop=True)
+
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        print(f"\033[91mThe journals differ in columns or rows: {list(expected.columns)} ({len(expected)}) vs {list(actual.columns)} ({len(actual)})\033[0m")
+        return 1
+    differences = expected != actual
+    if differences.any().any():
+        for column in expected.columns[differences.any()]:
+            rows = differences.index[differences[column]]
+            print(f"\033[91m{column}: {len(rows)} rows differ, e.g. row {rows[0]}: {expected.at[rows[0], column]!r} vs {actual.at[rows[0], column]!r}\033[0m")
+        return 1
+
+    print(f"\033[92mThe journal of {len(actual)} lines is identical to the row-wise implementation.\033[0m")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#
+# Checks of the converted ledger before the Maconomy import file is written, so errors are found here and not when the
+# Maconomy import fails. Every check is one group-by over the ledger, so the validation stays cheap on large batches:
+#   unbalanced - debit and credit differ per date and entity (Dato, Avdeling), summed exactly in øre
+#   unmapped   - job lines without a task, i.e. accounts/activities missing in the mapping
+#   orphaned   - travel IDs of the HL file that are not in the payroll report (the line gets the "Lønn" text)
+#   vat        - VAT codes on job lines of the HL file whose job is not a VAT project in the mapping (the company rules remove them)
+# The result is a DataFrame with one row per issue (check, severity, key, rows, amount in kroner).
+import pandas as pd
+from mapping_tables import MappingTables
+
+# The postings must balance per date and entity
+BALANCE_KEYS = ['Dato', 'Avdeling']
+
+CHECKS = {
+    'unbalanced': ('error',   "Debit and credit differ per date and entity"),
+    'unmapped':   ('error',   "Job lines without a task (account/activity missing in the mapping)"),
+    'vat':        ('warning', "VAT codes removed from jobs without VAT handling"),
+    'orphaned':   ('warning', "Travel IDs not found in the payroll report (the text is set to Lønn)"),
+}
+
+# One issue row per group, with the number of lines and the net amount (kroner) of the group
+def _issues(check: str, keys: list[str], totals: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({'check': check, 'severity': CHECKS[check][0], 'key': keys,
+                         'rows': totals['size'].to_numpy(), 'amount': totals['sum'].to_numpy() / 100})
+
+def _totals(df: pd.DataFrame, by) -> pd.DataFrame:
+    return df.groupby(by, dropna=False, observed=True)['Beløp'].agg(['sum', 'size'])
+
+def _label(value, name: str) -> str:
+    return f"{name} {value}" if pd.notna(value) else f"no {name}"
+
+# accounting_df is the ledger from process_input_files (the HL lines with tasks and texts),
+# ledger_df the ledger after company_specific_transactions, travel_ids the travel IDs of the payroll report.
+def validate_ledger(accounting_df: pd.DataFrame, ledger_df: pd.DataFrame, mapping: MappingTables, travel_ids: pd.Series = None) -> pd.DataFrame:
+    issues = []
+
+    totals = _totals(ledger_df, BALANCE_KEYS)
+    totals = totals[totals['sum'] != 0]
+    issues.append(_issues('unbalanced', [f"{dato:%Y-%m-%d} {_label(avdeling, 'entity')}" for dato, avdeling in totals.index], totals))
+
+    # The tasks are looked up on the accounts of the HL lines (before the company rules replace accounts)
+    unmapped = accounting_df['Prosjekt'].notna() & accounting_df['Oppgave'].isna()
+    totals = _totals(accounting_df[unmapped.to_numpy(dtype=bool)], 'Konto')
+    issues.append(_issues('unmapped', [f"account {konto}" for konto in totals.index], totals))
+
+    # The VAT codes are checked on the HL lines, company_specific_transactions sets them to 0 outside the VAT projects
+    vat = (accounting_df['MVA'] != 0) & accounting_df['Prosjekt'].notna() & ~accounting_df['Prosjekt'].isin(mapping.vat_projects)
+    totals = _totals(accounting_df[vat.to_numpy(dtype=bool)], 'Prosjekt')
+    issues.append(_issues('vat', [_label(prosjekt, 'job') for prosjekt in totals.index], totals))
+
+    if travel_ids is not None:
+        orphaned = accounting_df['ID'].notna() & ~accounting_df['ID'].isin(travel_ids)
+        totals = _totals(accounting_df[orphaned.to_numpy(dtype=bool)], 'ID')
+        issues.append(_issues('orphaned', [f"travel ID {travel_id}" for travel_id in totals.index], totals))
+
+    return pd.concat(issues, ignore_index=True)
+
+# Compact report: one line per check with the number of issues, and the first few keys
+def print_validation_report(issues: pd.DataFrame, max_keys: int = 5) -> None:
+    for check, check_issues in issues.groupby('check', sort=False):
+        severity, description = CHECKS[check]
+        color = "\033[91m" if severity == 'error' else "\033[93m"
+        print(f"{color}{severity.capitalize()}: {description}: {len(check_issues)} ({check_issues['rows'].sum()} lines)\033[0m")
+        for issue in check_issues.head(max_keys).itertuples(index=False):
+            print(f"{color}    {issue.key}: {issue.rows} lines, {issue.amount:.2f}\033[0m")
+        if len(check_issues) > max_keys:
+            print(f"{color}    ... and {len(check_issues) - max_keys} more\033[0m")
+
+def has_errors(issues: pd.DataFrame) -> bool:
+    return bool((issues['severity'] == 'error').any())
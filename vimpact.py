@@ -6,79 +6,205 @@ import os
 import warnings
 # Importing the functions from the modules
 from preprosessing import process_input_files
+from report_reader import read_report, REPORT_CACHE_DIR
+from validation import validate_ledger, print_validation_report, has_errors
 from company_specs import company_specific_transactions
-from maconomy import transform_to_maconomy
+from maconomy import transform_to_maconomy, maconomy_header, write_maconomy_text, write_maconomy_excel
 from datetime import datetime, timedelta
-
-# Choose API or Excel for mapping data
-from azure_auth import get_mapping_api
-# from get_mapping import get_mapping_data
+from profiling import stage, enable_profiling, print_profile, write_profile
+from export_state import STATE_DB, open_state, export_scope, select_new_transactions, commit_export
+from archive import ARCHIVE_DIR, archive_hl_file
+import argparse
+import sys
+
+# Choose API or Excel for mapping data (vimpact.py --mapping api|excel|cache)
+# The API mapping is cached locally (see mapping_cache.py) and falls back to mapping.xlsx when offline
+from mapping_cache import get_mapping, read_mapping_cache
+from get_mapping import get_mapping_data
+from mapping_tables import MappingTables, mapping_from_frame
 
 # Debugging help - print all rows in the DataFrame
 # pd.set_option('display.max_rows', None)
 
-# ***********************************************************************************
-# The main program code                                                             *
-# ***********************************************************************************        
-
-def main() -> None:
-    # Assigning the organization number for the Payroll file name
-    orgno:          str = "971274190"
-    
-    # Define the directory where the files are stored (users download directory)
-    downloads_dir:  str = os.path.join(os.path.expanduser("~"), "Downloads")
-
-    # API and Ouauth2.0 authentication
-    # We are using Azure APIM as a gateway to Maconomy and Entra ID for authentication (user auth)
-    client_id = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"  # Application (client) ID of app registration
-    tenant_id = "yyyyyyyy-yyyy-yyyy-yyyy-yyyyyyyyyyyy" # Directory (tenant) ID of tenant
-    scopes = ["api://zzzzzzz-zzzz-zzzz-zzzz-zzzzzzzzzzzz/.default"] # The clientID of the API app registration
-    api_gateway = "https://abcdefg.azure-api.net/maconomy" # The API gateway URL
-
-    # Calculate the date part of the accounting file name
-    today = datetime.today()
-    first_day_of_month = today.replace(day=1)
-    datepart:       str = first_day_of_month.strftime("%Y%m")
-    # Define the input files   
-    hl_filename:    str = os.path.join(downloads_dir, "HLTrans_" + orgno + "_" + datepart + ".HLT")
-    dr_filename:    str = os.path.join(downloads_dir, "Transaksjoner, detaljert.xlsx")
-
-    # Getting the mapping data from the Excel file or API
-    # mp_filename:    str = os.path.join("mapping.xlsx")
-    # mapping_df: pd.DataFrame = get_mapping_data(mp_filename)
-    mapping_df: pd.DataFrame = get_mapping_api(client_id, tenant_id, scopes, api_gateway)
-
+# API and Ouauth2.0 authentication
+# We are using Azure APIM as a gateway to Maconomy and Entra ID for authentication (user auth)
+CLIENT_ID = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"  # Application (client) ID of app registration
+TENANT_ID = "yyyyyyyy-yyyy-yyyy-yyyy-yyyyyyyyyyyy" # Directory (tenant) ID of tenant
+SCOPES = ["api://zzzzzzz-zzzz-zzzz-zzzz-zzzzzzzzzzzz/.default"] # The clientID of the API app registration
+API_GATEWAY = "https://abcdefg.azure-api.net/maconomy" # The API gateway URL
+
+# The conversion of one HL file: preprocessing, CICERO specific transactions and the Maconomy format.
+# With return_ledger the ledger after the company rules is returned with the journal, as (ledger_df, maconomy_df).
+def convert(hl_filename: str, dr_filename: str, mapping: MappingTables, report_cache_dir: str = REPORT_CACHE_DIR, validate: bool = True,
+            return_ledger: bool = False) -> pd.DataFrame:
     # Processing and preparing the accounting data
-    accounting_df: pd.DataFrame = process_input_files(hl_filename, dr_filename, mapping_df)
-
+    accounting_df: pd.DataFrame = process_input_files(hl_filename, dr_filename, mapping, report_cache_dir)
+    if accounting_df is None:
+        return None
+
+    # The travel IDs of the payroll report (already read by process_input_files, so this is served from memory)
+    travel_ids = read_report(dr_filename, report_cache_dir)['Reiseregning ID'] if validate else None
+    return convert_ledger(accounting_df, mapping, travel_ids, validate, return_ledger)
+
+# The conversion of the prepared accounting data: CICERO specific transactions and the Maconomy format.
+# The ledger is validated (see validation.py) before it is returned. With errors the journal is not returned (None).
+def convert_ledger(accounting_df: pd.DataFrame, mapping: MappingTables, travel_ids: pd.Series = None, validate: bool = True,
+                   return_ledger: bool = False) -> pd.DataFrame:
     # Adding CICERO specific debit/credit transactions to the accounting data
-    cicero_accounting_df: pd.DataFrame = company_specific_transactions(accounting_df, mapping_df)
+    with stage("company rules", rows_in=len(accounting_df)) as s:
+        cicero_accounting_df: pd.DataFrame = company_specific_transactions(accounting_df, mapping)
+        s['rows_out'] = len(cicero_accounting_df)
 
     # Transforming the accounting data to Maconomy format.
     # NB: If you do not want the CICERO-sepcific transactions, you can specify accounting_df instead of cicero_accounting_df.
-    maconomy_df: pd.DataFrame = transform_to_maconomy(cicero_accounting_df)
+    with stage("Maconomy transform", rows_in=len(cicero_accounting_df)) as s:
+        maconomy_df: pd.DataFrame = transform_to_maconomy(cicero_accounting_df)
+        s['rows_out'] = len(maconomy_df)
+
+    # Fail fast before the import file is written if the journal doesn't balance or lacks tasks
+    if validate:
+        with stage("validation", rows_in=len(cicero_accounting_df)) as s:
+            issues = validate_ledger(accounting_df, cicero_accounting_df, mapping, travel_ids)
+            s['rows_out'] = len(issues)
+        if len(issues) > 0:
+            print_validation_report(issues)
+        if has_errors(issues):
+            print(f"\033[91mThe ledger did not pass the validation, the Maconomy import file is not written (use --skip-validation to write it anyway).\033[0m")
+            return None
+
+    return (cicero_accounting_df, maconomy_df) if return_ledger else maconomy_df
+
+# Getting the mapping data from the API (cached), the cache only ("cache") or the Excel file ("excel").
+# The Maconomy API modules (msal, requests) are only imported when the API is called. Returns None if there is no mapping.
+# The mapping is returned compiled to lookup tables (see mapping_tables.py).
+def load_mapping(source: str = "api", mp_filename: str = "mapping.xlsx", ttl_hours: float = 24, refresh: bool = False) -> MappingTables:
+    if source == "excel":
+        mapping_df = get_mapping_data(mp_filename)
+        return mapping_from_frame(mapping_df) if mapping_df is not None else None
+    if source == "cache":
+        mapping = read_mapping_cache()
+        if mapping is not None:
+            print(f"\033[92m1) The mapping data was read from the cache.\033[0m")
+        return mapping
+    return get_mapping(CLIENT_ID, TENANT_ID, SCOPES, API_GATEWAY, ttl_hours=ttl_hours, refresh=refresh, mp_filename=mp_filename)
+
+# ***********************************************************************************
+# The main program code                                                             *
+# ***********************************************************************************        
 
-    # Static assignment of a DataFrame with three columns
-    mac_header_df = pd.DataFrame({
-        'Column1': ['JOURNAL:Format','JOURNAL:CREATE'],
-        'Column2': ['TransactionNumberSeries','Lønn'],
-        'Column3': ['CompanyNumber','1']
-    })
+def main(argv: list[str] = None) -> int:
+    # Calculate the date part of the accounting file name (the current month)
+    datepart:       str = datetime.today().replace(day=1).strftime("%Y%m")
+    # Define the directory where the files are stored (users download directory)
+    downloads_dir:  str = os.path.join(os.path.expanduser("~"), "Downloads")
 
-    # Writing the Maconomy DataFrame to an Excel file
+    parser = argparse.ArgumentParser(description="Convert the Visma Payroll accounting file to a Maconomy import file.")
+    parser.add_argument("hl_file", nargs="?", help="The H & L accounting file (default: HLTrans_<orgno>_<current month>.HLT in the Downloads folder)")
+    parser.add_argument("--report", help="The payroll report (default: Transaksjoner, detaljert.xlsx next to the H & L file)")
+    parser.add_argument("--orgno", default="971274190", help="Organization number of the default H & L file name")
+    parser.add_argument("--mapping", choices=["api", "excel", "cache"], default="api",
+                        help="Mapping source: the Maconomy API (cached, see mapping_cache.py), the mapping Excel file or the cached API mapping only")
+    parser.add_argument("--mapping-file", default="mapping.xlsx", help="The mapping Excel file (--mapping excel, and the fallback when the API can't be reached)")
+    parser.add_argument("--mapping-ttl", type=float, default=24, help="Hours the cached API mapping is used before it is downloaded again")
+    parser.add_argument("--refresh-mapping", action="store_true", help="Download the mapping even if the cached mapping is fresh")
+    parser.add_argument("--output-format", choices=["txt", "xlsx", "both"], default="txt",
+                        help="out.txt (ready for Import General Journal), out.xlsx or both")
+    parser.add_argument("--output-dir", help="Directory of the import file (default: the directory of the H & L file)")
+    parser.add_argument("--profile", action="store_true", help="Print the time, rows and peak memory of every stage")
+    parser.add_argument("--profile-report", help="Append the stage measurements of this run to this JSONL file (implies --profile)")
+    parser.add_argument("--incremental", action="store_true", help="Only convert the HL lines that have not been exported before (see export_state.py)")
+    parser.add_argument("--reverse-missing", action="store_true", help="With --incremental: reverse the exported lines that are no longer in the HL file")
+    parser.add_argument("--state-db", default=STATE_DB, help="The state store of the exported lines")
+    parser.add_argument("--skip-validation", action="store_true", help="Write the import file even if the ledger doesn't pass the validation (see validation.py)")
+    parser.add_argument("--archive", nargs="?", const=ARCHIVE_DIR, metavar="DIR",
+                        help=f"Archive the ledger and the journal in the Parquet archive (default {ARCHIVE_DIR}, see archive.py)")
+    args = parser.parse_args(argv)
+
+    if args.profile or args.profile_report:
+        enable_profiling()
+
+    # Define the input files
+    hl_filename:    str = os.path.expanduser(args.hl_file) if args.hl_file else os.path.join(downloads_dir, "HLTrans_" + args.orgno + "_" + datepart + ".HLT")
+    dr_filename:    str = os.path.expanduser(args.report) if args.report else os.path.join(os.path.dirname(hl_filename), "Transaksjoner, detaljert.xlsx")
+    output_dir:     str = os.path.expanduser(args.output_dir) if args.output_dir else os.path.dirname(hl_filename)
+
+    with stage("mapping") as s:
+        mapping: MappingTables = load_mapping(args.mapping, args.mapping_file, args.mapping_ttl, args.refresh_mapping)
+        s['rows_out'] = len(mapping.accounts) if mapping is not None else 0
+    if mapping is None:
+        print(f"\033[91mNo mapping data ({args.mapping}), nothing is converted.\033[0m")
+        return 1
+
+    # Converting the accounting data to the Maconomy import format
+    # In incremental mode only the lines that have not been exported before (and the reversals) are converted
+    nothing_new = False
+    result = None
+    if args.incremental:
+        state = open_state(args.state_db)
+        accounting_df: pd.DataFrame = process_input_files(hl_filename, dr_filename, mapping)
+        if accounting_df is not None:
+            with stage("incremental filter", rows_in=len(accounting_df)) as s:
+                accounting_df, pending_export = select_new_transactions(state, export_scope(hl_filename), accounting_df, args.reverse_missing)
+                s['rows_out'] = len(accounting_df) if accounting_df is not None else 0
+            # accounting_df is None if changed lines were found without --reverse-missing (nothing is exported)
+            if accounting_df is not None and len(accounting_df) > 0:
+                travel_ids = read_report(dr_filename)['Reiseregning ID']
+                result = convert_ledger(accounting_df, mapping, travel_ids, validate=not args.skip_validation, return_ledger=True)
+            elif accounting_df is not None:
+                print(f"\033[93mNothing new to export.\033[0m")
+                nothing_new = True
+    else:
+        result = convert(hl_filename, dr_filename, mapping, validate=not args.skip_validation, return_ledger=True)
+    ledger_df, maconomy_df = result if result is not None else (None, None)
+
+    # The journal header of the import file
+    mac_header_df = maconomy_header()
+
+    # Writing the Maconomy DataFrame to the import file(s)
+    written = False
     if maconomy_df is not None:
-        output_filename = os.path.join(os.path.dirname(hl_filename), "out.xlsx")
-
-        try:
-            mac_header_df.to_excel(output_filename, index=False, header=False)
-            with pd.ExcelWriter(output_filename, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                maconomy_df.to_excel(writer, index=False, startrow=len(mac_header_df) + 1)
-        except Exception as e:
-            print(f"\033[91mError writing the Maconomy import file: {e}\033[0m")
-        else:                      
-            print(f"\033[95mDataFrame written to {output_filename} successfully.\033[0m")
+        output_filenames = []
+        if args.output_format in ("txt", "both"):
+            output_filenames.append(os.path.join(output_dir, "out.txt"))
+        if args.output_format in ("xlsx", "both"):
+            output_filenames.append(os.path.join(output_dir, "out.xlsx"))
+
+        os.makedirs(output_dir, exist_ok=True)
+        written = True
+        for output_filename in output_filenames:
+            try:
+                with stage(f"output write {os.path.basename(output_filename)}", rows_in=len(maconomy_df)):
+                    if output_filename.endswith(".txt"):
+                        write_maconomy_text(mac_header_df, maconomy_df, output_filename)
+                    else:
+                        write_maconomy_excel(mac_header_df, maconomy_df, output_filename)
+            except Exception as e:
+                print(f"\033[91mError writing the Maconomy import file: {e}\033[0m")
+                written = False
+            else:
+                print(f"\033[95mDataFrame written to {output_filename} successfully.\033[0m")
+
+        # The exported lines are recorded once the journal is written
+        if args.incremental and written:
+            commit_export(state, pending_export, hl_filename)
+
+        # The archive gets the written conversions (incremental runs add their lines to the month)
+        if args.archive and written:
+            try:
+                with stage("archive", rows_in=len(ledger_df)):
+                    archive_hl_file(hl_filename, ledger_df, maconomy_df, os.path.expanduser(args.archive), append=args.incremental)
+            except Exception as e:
+                print(f"\033[91mError archiving the conversion: {e}\033[0m")
+
+    if args.profile or args.profile_report:
+        print_profile()
+    if args.profile_report:
+        write_profile(args.profile_report, hl_file=hl_filename, report_file=dr_filename)
+
+    # Exit code 1 if nothing was written because of an error ("nothing new to export" is not an error)
+    return 0 if written or nothing_new else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
 ### Fine
\ No newline at end of file
@@ -0,0 +1,138 @@
+#
+# Watch mode: a long running process that converts new H & L exports as soon as they arrive in a folder (e.g. Downloads).
+# The folder is polled every few seconds (no extra dependency). A file is only used when its size and modification time
+# have not changed for --settle seconds, so files that are still being written (or downloaded) are left alone.
+#
+# An HL file (HLTrans_<orgno>_<YYYYMM>.HLT) is converted together with the payroll report once the report is there and was
+# exported around the same time as the HL file (within --pair-window seconds), so the report of an earlier export is not used.
+# The journal is written as Maconomy_<orgno>_<period>.txt, like batch.py. The process, the imports, the mapping and the
+# Maconomy login (token cache) stay warm in memory, and the mapping is loaded again when it is older than --mapping-ttl.
+# With --archive the ledgers and journals are also archived (see archive.py).
+#
+# Example: python watch.py --dir ~/Downloads --mapping cache
+import argparse
+import os
+import time
+from datetime import datetime
+from batch import convert_file
+from hlt_reader import HLT_FILENAME_PATTERN
+from archive import ARCHIVE_DIR
+from vimpact import load_mapping
+
+# Size and modification time of the files in the folder
+def scan(directory: str) -> dict[str, tuple[int, int]]:
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+# Files whose size and modification time have not changed for settle seconds (and that can be opened).
+# tracked holds the signature of every file and the time it has had that signature (its modification time, at the latest now).
+def settled_files(files: dict[str, tuple[int, int]], tracked: dict, now: float, settle: float) -> set[str]:
+    settled = set()
+    for filename, signature in files.items():
+        if filename not in tracked or tracked[filename][0] != signature:
+            tracked[filename] = (signature, min(now, signature[1] / 1e9))
+        if now - tracked[filename][1] >= settle and signature[0] > 0:
+            try:
+                # Excel and the browser keep the file locked while it is written (on Windows)
+                with open(filename, 'rb'):
+                    settled.add(filename)
+            except OSError:
+                pass
+    for filename in set(tracked) - set(files):
+        del tracked[filename]
+    return settled
+
+def watch(directory: str, output_dir: str = None, report_template: str = "Transaksjoner, detaljert.xlsx", companies: dict[str, str] = None,
+          mapping_source: str = "api", mp_filename: str = "mapping.xlsx", mapping_ttl_hours: float = 24,
+          interval: float = 2, settle: float = 3, pair_window: float = 600, convert_existing: bool = False, once: bool = False,
+          archive_dir: str = None, validate: bool = True) -> None:
+    directory = os.path.expanduser(directory)
+    output_dir = os.path.expanduser(output_dir) if output_dir else directory
+    os.makedirs(output_dir, exist_ok=True)
+    archive_dir = os.path.expanduser(archive_dir) if archive_dir else None
+    companies = companies or {}
+
+    # The mapping is loaded up front and kept warm
+    mapping = load_mapping(mapping_source, mp_filename, mapping_ttl_hours)
+    if mapping is None:
+        print(f"\033[91mNo mapping data ({mapping_source}), the folder is not watched.\033[0m")
+        return
+    mapping_loaded = time.time()
+
+    tracked = {}
+    # The HL files converted (or already there at the start) with their signature, and the HL files waiting for the report
+    done = {} if convert_existing else {filename: signature for filename, signature in scan(directory).items()}
+    waiting = set()
+    print(f"\033[96mWatching {directory} for H & L files (Ctrl+C to stop)...\033[0m")
+
+    try:
+        while True:
+            now = time.time()
+            files = scan(directory)
+            settled = settled_files(files, tracked, now, settle)
+
+            for hl_filename in sorted(settled):
+                match = HLT_FILENAME_PATTERN.search(os.path.basename(hl_filename))
+                if not match or done.get(hl_filename) == files[hl_filename]:
+                    continue
+                orgno, period = match.groups()
+
+                # The report must be settled and exported around the same time as the HL file
+                dr_filename = os.path.join(directory, os.path.expanduser(report_template.format(orgno=orgno, period=period)))
+                hl_mtime = files[hl_filename][1] / 1e9
+                if dr_filename not in settled or files[dr_filename][1] / 1e9 < hl_mtime - pair_window:
+                    if hl_filename not in waiting:
+                        print(f"\033[93m{os.path.basename(hl_filename)}: waiting for the payroll report {os.path.basename(dr_filename)}.\033[0m")
+                        waiting.add(hl_filename)
+                    continue
+                waiting.discard(hl_filename)
+
+                # Reload the mapping when it is older than the TTL (the API login uses the token cache in memory)
+                if now - mapping_loaded > mapping_ttl_hours * 3600:
+                    reloaded = load_mapping(mapping_source, mp_filename, mapping_ttl_hours)
+                    if reloaded is not None:
+                        mapping = reloaded
+                    mapping_loaded = now
+
+                output_filename = os.path.join(output_dir, f"Maconomy_{orgno}_{period}.txt")
+                summary = convert_file(hl_filename, dr_filename, output_filename, companies.get(orgno, '1'), mapping, archive_dir, validate)
+                done[hl_filename] = files[hl_filename]
+                color = "\033[95m" if summary['status'] == 'ok' else "\033[91m"
+                print(f"{color}{datetime.now():%H:%M:%S} {os.path.basename(hl_filename)}: {summary['status']} {summary['error']}"
+                      f" ({summary['rows']} lines, {summary['seconds']} s) -> {output_filename}\033[0m")
+
+            if once:
+                return
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print(f"\033[96mStopped watching {directory}.\033[0m")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Watch a folder and convert new Visma HL files to Maconomy journals.")
+    parser.add_argument("--dir", default=os.path.join("~", "Downloads"), help="The folder the HL files and payroll reports are exported to")
+    parser.add_argument("--output-dir", help="Directory of the journals (default: the watched folder)")
+    parser.add_argument("--report", default="Transaksjoner, detaljert.xlsx", help="Payroll report file name, may contain {orgno} and {period}")
+    parser.add_argument("--company", nargs="*", default=[], help="Maconomy company number per organization number as ORGNO=COMPANY (default 1)")
+    parser.add_argument("--mapping", choices=["api", "excel", "cache"], default="api", help="Mapping source (see vimpact.py)")
+    parser.add_argument("--mapping-file", default="mapping.xlsx", help="The mapping Excel file")
+    parser.add_argument("--mapping-ttl", type=float, default=24, help="Hours before the mapping is loaded again")
+    parser.add_argument("--interval", type=float, default=2, help="Seconds between the scans of the folder")
+    parser.add_argument("--settle", type=float, default=3, help="Seconds a file must be unchanged before it is used")
+    parser.add_argument("--pair-window", type=float, default=600, help="Seconds the payroll report may be older than the HL file")
+    parser.add_argument("--convert-existing", action="store_true", help="Also convert the HL files that are in the folder at the start")
+    parser.add_argument("--once", action="store_true", help="Convert what is ready and stop (no watching)")
+    parser.add_argument("--skip-validation", action="store_true", help="Write the journals even if the ledgers don't pass the validation (see validation.py)")
+    parser.add_argument("--archive", nargs="?", const=ARCHIVE_DIR, metavar="DIR", help=f"Archive the ledgers and journals (default {ARCHIVE_DIR}, see archive.py)")
+    args = parser.parse_args()
+
+    companies = dict(company.split("=", 1) for company in args.company)
+    watch(args.dir, args.output_dir, args.report, companies, args.mapping, args.mapping_file, args.mapping_ttl,
+          args.interval, args.settle, args.pair_window, args.convert_existing, args.once, args.archive, not args.skip_validation)
+
+if __name__ == "__main__":
+    main()